@@ -11,6 +11,9 @@ __author__ = 'cpio'
 
 LOG = logging.getLogger(__name__)
 
+# Seconds an idle SSH master connection is kept for the next command
+SSH_CONTROL_PERSIST = 60
+
 
 class NativeCmdRunner(threading.Thread):
 
@@ -140,17 +143,43 @@ class SSHCmdRunner(NativeCmdRunner):
     Run SSH command
     """
 
-    def __init__(self, cmdarr, ssh_id_key, port, user="root", ip="127.0.0.1"):
+    def __init__(self, cmdarr, ssh_id_key, port, user="root", ip="127.0.0.1",
+                 control_path=None):
         super().__init__(cmdarr)
         os.chmod(ssh_id_key, 0o600)
         self._cmdarr = [
-            "ssh", "-v", "-i", ssh_id_key,
+            "ssh", "-i", ssh_id_key,
             f"{user}@{ip}", "-p", f"{port}",
             "-o", "StrictHostKeyChecking=no",
             "-o", "UserKnownHostsFile=/dev/null",
             "-o", "ConnectTimeout=30",
             "-o", "PreferredAuthentications=publickey",
-        ] + cmdarr
+        ]
+        if control_path is not None:
+            # Share one connection between the commands to the same guest, the
+            # first command becomes the master and is kept for a while after
+            # it exits. No "-v" here: a verbose master keeps the stderr pipe
+            # open in the background and the reader would wait on it.
+            self._cmdarr += [
+                "-o", "ControlMaster=auto",
+                "-o", f"ControlPath={control_path}",
+                "-o", f"ControlPersist={SSH_CONTROL_PERSIST}",
+            ]
+        else:
+            self._cmdarr.insert(1, "-v")
+        self._cmdarr += cmdarr
+
+    @staticmethod
+    def close_master(control_path):
+        """
+        Stop the master connection behind control_path if it is running.
+        """
+        if not os.path.exists(control_path):
+            return
+        runner = NativeCmdRunner(
+            ["ssh", "-o", f"ControlPath={control_path}", "-O", "exit", "guest"],
+            silent=True)
+        runner.runwait()
 
     @property
     def logprefix(self):
@@ -1,6 +1,7 @@
 """
 Manage the DUT(Device Under Test)
 """
+import functools
 import logging
 import socket
 import queue
@@ -26,6 +27,18 @@ class DUT:
         """
         return 'tdx' in cpuinfo.get_cpu_info()['flags']
 
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def kvm_support_tdx():
+        """
+        Check whether TDX is enabled in the kvm_intel module, TD guests can
+        not be created otherwise.
+        """
+        tdx_param = "/sys/module/kvm_intel/parameters/tdx"
+        if not os.path.exists(tdx_param):
+            return False
+        return DUT.file_contains(tdx_param, "Y")
+
     @staticmethod
     def support_sgx():
         """
@@ -33,6 +46,21 @@ class DUT:
         """
         return 'sgx' in cpuinfo.get_cpu_info()['flags']
 
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def support_amx():
+        """
+        Check whether support AMX in /proc/cpuinfo, the flags are read once
+        since they do not change during the process.
+        """
+        with open("/proc/cpuinfo", "r", encoding="utf8") as fobj:
+            for line in fobj:
+                if line.startswith("flags"):
+                    flags = line.split(":", 1)[1].split()
+                    return all(flag in flags for flag in
+                               ("amx_bf16", "amx_tile", "amx_int8"))
+        return False
+
     @staticmethod
     def cmdline_contains(needle):
         """
@@ -78,10 +106,12 @@ class DUT:
         return False
 
     @staticmethod
+    @functools.lru_cache(maxsize=1)
     def get_cpu_base_freq():
         """
         psutil does not return correct frequency value, so read
-        /sys/devices/system/cpu/cpu0/cpufreq/base_frequency
+        /sys/devices/system/cpu/cpu0/cpufreq/base_frequency, the value is
+        cached since it is read on every VM creation.
         """
         with open("/sys/devices/system/cpu/cpu0/cpufreq/base_frequency",
                 "r", encoding="utf8") \
@@ -92,9 +122,11 @@ class DUT:
         return None
 
     @staticmethod
+    @functools.lru_cache(maxsize=1)
     def get_distro():
         """
-        Get host distro information
+        Get host distro information, it does not change during the process
+        so the result is cached.
         """
         if os.path.exists("/etc/os-release"):
             with open("/etc/os-release", "r", encoding="utf8") as fobj:
@@ -38,6 +38,7 @@ class MSR:
     IA32_MKTME_PARTITIONING = 0x87
     IA32_TME_CAPABILITY = 0x981
     IA32_TME_ACTIVATE = 0x982
+    IA32_SEAMRR_PHYS_MASK = 0x1401
 
     def __init__(self):
         self._check_kmod()
@@ -68,6 +69,17 @@ class MSR:
         val = struct.unpack('Q', os.read(fdobj, 8))[0]
         os.close(fdobj)
 
+        return MSR.getbits(val, highbit, lowbit)
+
+    @staticmethod
+    def getbits(val, highbit=63, lowbit=0):
+        """
+        Get the bits from lowbit to highbit of a MSR value which is already
+        read, so several fields of one register only need one read.
+        """
+        if val is None:
+            return None
+
         bits = highbit - lowbit + 1
         if bits < 64:
             val >>= lowbit
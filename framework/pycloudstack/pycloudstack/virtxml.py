@@ -2,6 +2,7 @@
 Libvirt XML class manage the xml file for VM define, create, destroy.
 """
 import os
+import copy
 import logging
 import uuid
 import xml.etree.ElementTree as ET
@@ -42,6 +43,9 @@ class VirtXml:
 
     _OUTPUT = THIS_DIR
 
+    # Parsed template trees keyed by template file path
+    _TEMPLATE_CACHE = {}
+
     def __init__(self):
         self._tree = None
         self._name = None
@@ -58,6 +62,8 @@ class VirtXml:
         self._cores = None
         self._threads = None
         self._qemu_exec = None
+        # Serialized XML, refreshed after every modification
+        self._xmlstr = None
 
     @property
     def name(self):
@@ -72,7 +78,7 @@ class VirtXml:
             return
         if self._set_single_element_value(["name", ], new_name):
             self._name = new_name
-        self.save()
+        self._modified()
 
     @property
     def uuid(self):
@@ -87,7 +93,7 @@ class VirtXml:
             return
         if self._set_single_element_value(["uuid", ], new_uuid):
             self._uuid = new_uuid
-        self.save()
+        self._modified()
 
     @property
     def kernel(self):
@@ -106,7 +112,7 @@ class VirtXml:
         else:
             if self._set_single_element_value(["os", "kernel"], new_kernel):
                 self._kernel = new_kernel
-        self.save()
+        self._modified()
 
     @property
     def loader(self):
@@ -121,7 +127,7 @@ class VirtXml:
             return
         if self._set_single_element_value(["os", "loader"], new_loader):
             self._loader = new_loader
-        self.save()
+        self._modified()
 
     @property
     def cmdline(self):
@@ -140,7 +146,7 @@ class VirtXml:
         else:
             if self._set_single_element_value(["os", "cmdline"], new_cmdline):
                 self._cmdline = new_cmdline
-        self.save()
+        self._modified()
 
     @property
     def memory(self):
@@ -160,7 +166,7 @@ class VirtXml:
             return
         if self._set_single_element_value(["memory", ], new_memory):
             self._memory = new_memory
-        self.save()
+        self._modified()
 
     @property
     def vcpu(self):
@@ -180,7 +186,7 @@ class VirtXml:
             return
         if self._set_single_element_value(["vcpu", ], new_vcpu):
             self._vcpu = new_vcpu
-            self.save()
+            self._modified()
         else:
             LOG.error("Fail to set vcpu in virt XML")
 
@@ -202,7 +208,7 @@ class VirtXml:
             return
         if self._set_single_element_attrib(["cpu", "topology"], "sockets", new_value):
             self._sockets = new_value
-            self.save()
+            self._modified()
         else:
             LOG.error("Fail to set sockets in virt XML")
 
@@ -224,7 +230,7 @@ class VirtXml:
             return
         if self._set_single_element_attrib(["cpu", "topology"], "cores", new_value):
             self._cores = new_value
-            self.save()
+            self._modified()
         else:
             LOG.error("Fail to set cores in virt XML")
 
@@ -246,7 +252,7 @@ class VirtXml:
             return
         if self._set_single_element_attrib(["cpu", "topology"], "threads", new_value):
             self._threads = new_value
-            self.save()
+            self._modified()
         else:
             LOG.error("Fail to set threads in virt XML")
 
@@ -264,7 +270,7 @@ class VirtXml:
         _, image_dom = self._find_single_element(["devices", "disk", "source"])
         image_dom.set("file", new_file)
         self._imagefile = new_file
-        self.save()
+        self._modified()
 
     @property
     def iomode(self):
@@ -280,7 +286,7 @@ class VirtXml:
         _, driver_dom = self._find_single_element(["devices", "disk", "driver"])
         driver_dom.set("io", iomode)
         self._io = iomode
-        self.save()
+        self._modified()
 
     @property
     def cache(self):
@@ -296,7 +302,7 @@ class VirtXml:
         _, driver_dom = self._find_single_element(["devices", "disk", "driver"])
         driver_dom.set("cache", cache)
         self._cache = cache
-        self.save()
+        self._modified()
 
     @property
     def logfile(self):
@@ -312,7 +318,7 @@ class VirtXml:
         _, log_dom = self._find_single_element(["devices", "console", "log"])
         log_dom.set("file", new_file)
         self._logfile = new_file
-        self.save()
+        self._modified()
 
     @property
     def qemu_exec(self):
@@ -327,7 +333,7 @@ class VirtXml:
             return
         if self._set_single_element_value(["devices", "emulator"], qemu_exec):
             self._qemu_exec = qemu_exec
-        self.save()
+        self._modified()
 
     @property
     def filepath(self):
@@ -375,15 +381,19 @@ class VirtXml:
         if self._tree is not None and dump_xml:
             ET.dump(self._tree)
 
-    def load(self, filepath):
+    def load(self, filepath, tree=None):
         """
-        Load virt XML from given filepath
+        Load virt XML from given filepath, or use the given pre-parsed tree
+        which was loaded from filepath.
         """
-        if not os.path.exists(filepath):
-            LOG.error("Fail to find the xml file %s", filepath)
-            return False
+        if tree is None:
+            if not os.path.exists(filepath):
+                LOG.error("Fail to find the xml file %s", filepath)
+                return False
+            tree = ET.parse(filepath)
 
-        self._tree = ET.parse(filepath)
+        self._tree = tree
+        self._xmlstr = None
         self._name = self._get_single_element_value(["name", ])
         self._uuid = self._get_single_element_value(["uuid", ])
         self._kernel = self._get_single_element_value(["os", "kernel"])
@@ -400,9 +410,16 @@ class VirtXml:
         self._filepath = filepath
         return True
 
+    def _modified(self):
+        """
+        Called by every modification, the file is only written by save()
+        """
+        self._xmlstr = None
+
     def save(self, filepath=None):
         """
-        Save virt XML to given filepath
+        Save virt XML to given filepath, or the associated file if not given.
+        The modifications are not written until save() is called.
         """
         if filepath is None:
             if self._filepath is None:
@@ -410,6 +427,7 @@ class VirtXml:
             else:
                 filepath = self._filepath
 
+        self._xmlstr = None
         try:
             rawstr = "".join([item.strip() for item in self.tostring().split("\n")])
             xmlstr = minidom.parseString(rawstr).toprettyxml(indent="  ")
@@ -427,7 +445,9 @@ class VirtXml:
         """
         Dump the virt XML to string
         """
-        return ET.tostring(self._tree.getroot(), encoding='unicode')
+        if self._xmlstr is None:
+            self._xmlstr = ET.tostring(self._tree.getroot(), encoding='unicode')
+        return self._xmlstr
 
     def customize(self, imagefile, vmid=None, name=None, kernel=None,
     loader=None, memory=2097152, cmdline=None):
@@ -653,7 +673,7 @@ class VirtXml:
             [f"{QEMUS_NS}commandline", f"{QEMUS_NS}arg"],
             {"value": f"user,id=mynet0,hostfwd=tcp::{port}-:22"},
             allow_multi_same_leaf=True)
-        self.save()
+        self._modified()
 
     def set_hugepage_params(self, hugepage_size):
         """
@@ -665,7 +685,7 @@ class VirtXml:
         self._add_new_element(
             ["memoryBacking", "hugepages", "page"],
             {"unit": f"{unit}", "size": f"{size}"})
-        self.save()
+        self._modified()
 
     def set_driver(self, driver):
         """
@@ -675,7 +695,7 @@ class VirtXml:
             ["devices", "interface"],"type", "bridge")
         self._add_new_element_by_parent(
             interface, ["driver"],{"name":driver})
-        self.save()
+        self._modified()
 
     def set_cpu_params(self, cpu_param):
         """
@@ -689,7 +709,7 @@ class VirtXml:
             [f"{QEMUS_NS}commandline", f"{QEMUS_NS}arg"],
             {"value": f"{cpu_param}"},
             allow_multi_same_leaf=True)
-        self.save()
+        self._modified()
 
     def set_overcommit_params(self, overcommit_param):
         """
@@ -703,7 +723,7 @@ class VirtXml:
             [f"{QEMUS_NS}commandline", f"{QEMUS_NS}arg"],
             {"value": f"{overcommit_param}"},
             allow_multi_same_leaf=True)
-        self.save()
+        self._modified()
 
     def bind_cpuids(self, cpu_ids):
         """
@@ -720,7 +740,7 @@ class VirtXml:
             self._add_new_element(["cputune", "vcpupin"],
                                   {"vcpu": f"{vcpu_id}", "cpuset": f"{cpu_id}"}, True)
             vcpu_id += 1
-        self.save()
+        self._modified()
 
     def set_mem_numa(self, memnuma):
         """
@@ -732,7 +752,7 @@ class VirtXml:
             self._set_single_element_attrib(["numatune", "memory"], "nodeset", "0")
         else:
             self._set_single_element_attrib(["numatune", "memory"], "nodeset", "1")
-        self.save()
+        self._modified()
 
     def set_epc_params(self, epc_param):
         """
@@ -766,7 +786,7 @@ class VirtXml:
                 [f"{QEMUS_NS}commandline", f"{QEMUS_NS}arg"],
                 {"value": f"{sgx_epc[:-1]}"},
                 allow_multi_same_leaf=True)
-        self.save()
+        self._modified()
 
     def set_vsock(self, cid):
         """
@@ -777,7 +797,7 @@ class VirtXml:
             {"auto": "no", "address": str(cid)}
         )
         self._set_single_element_attrib(["devices", "vsock"], "model", "virtio")
-        self.save()
+        self._modified()
 
     def set_disk(self, diskfile_path):
         """
@@ -790,7 +810,7 @@ class VirtXml:
             f"{self._cache}", "iothread": "2"})
         self._add_new_element_by_parent(new_disk_leaf, ["source"], {"file": f"{diskfile_path}"})
         self._add_new_element_by_parent(new_disk_leaf, ["target"], {"dev": "vdb", "bus": "virtio"})
-        self.save()
+        self._modified()
 
     def set_hugepage_path(self, hugepage_path):
         """
@@ -799,7 +819,7 @@ class VirtXml:
         self._add_new_element(["memoryBacking", "path"])
         self._set_single_element_value(["memoryBacking", "path"], f"{hugepage_path}")
 
-        self.save()
+        self._modified()
 
     def set_vtpm_param(self, vtpm_path, vtpm_log):
         """
@@ -810,7 +830,7 @@ class VirtXml:
         self._add_new_element(["launchSecurity", "vtpm", "log"])
         self._set_single_element_value(["launchSecurity", "vtpm", "log"], f"{vtpm_log}")
 
-        self.save()
+        self._modified()
 
     @staticmethod
     def get_templates_dir():
@@ -853,8 +873,15 @@ class VirtXml:
         newxml_full_path = os.path.join(
             cls.get_output_dir(), new_name + ".xml")
 
+        # Parse each template only once, every clone gets its own copy
+        template = cls._TEMPLATE_CACHE.get(template_full_path)
+        if template is None:
+            template = ET.parse(template_full_path)
+            cls._TEMPLATE_CACHE[template_full_path] = template
+
         obj = cls()
-        obj.load(template_full_path)
-        obj.save(newxml_full_path)
+        obj.load(template_full_path, copy.deepcopy(template))
+        # The file is written by save() once the XML is complete
+        obj._filepath = newxml_full_path
         obj.name = new_name
         return obj
@@ -9,6 +9,11 @@ import socket
 import errno
 import datetime
 import getpass
+import hashlib
+import threading
+import contextlib
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 import libvirt
 from .cmdrunner import SSHCmdRunner, NativeCmdRunner
 from .dut import DUT
@@ -37,7 +42,17 @@ LOG = logging.getLogger(__name__)
 
 LOOPBACK = "127.0.0.1"
 DEFAULT_SSH_PORT = 22
-DEFAULT_CHECK_INTERVAL = 1
+DEFAULT_CHECK_INTERVAL = 0.1
+# Timeout of one connect/recv on the SSH port, so a probe never blocks for the
+# whole boot timeout
+SSH_PROBE_TIMEOUT = 5
+# Exponential backoff of the "expo" strategy of wait_for_ssh_ready()
+SSH_BACKOFF_BASE = 0.05
+SSH_BACKOFF_FACTOR = 1.6
+SSH_BACKOFF_MAX = 1.0
+# With the "expo" strategy, give up if the guest keeps refusing the SSH
+# connection for this long since sshd is not going to start
+SSH_REFUSED_TIMEOUT = 60
 
 
 class VMGuest:
@@ -135,14 +150,19 @@ class VMGuest:
             self.cmdline.add_field_from_string(rootfs_centos)
 
         self.ssh_forward_port = DUT.find_free_port()
+        # The SSH commands to this guest share one master connection
+        self.ssh_control_path = f"/tmp/ssh-{self.vmid or self.name}"
         LOG.info("VM SSH forward: %d", self.ssh_forward_port)
-        assert isinstance(self.image, VMImage)
+        if not isinstance(self.image, VMImage):
+            raise ValueError("image should be a VMImage")
         if self.boot == BOOT_TYPE_DIRECT:
-            assert self.kernel is not None
-            assert os.path.exists(self.kernel)
+            if self.kernel is None or not os.path.exists(self.kernel):
+                raise ValueError(f"Invalid kernel {self.kernel} for direct boot")
             self.kernel = os.path.realpath(self.kernel)
 
         self.vmm = vmm_class(self)
+        # Pending define started by define_async()
+        self._define_future = None
 
     def ssh_run(self, cmdarr, ssh_id_key, no_wait=False):
         """
@@ -154,11 +174,13 @@ class VMGuest:
 
         try:
             runner = SSHCmdRunner(
-                cmdarr, ssh_id_key, DEFAULT_SSH_PORT, ip=self.get_ip()
+                cmdarr, ssh_id_key, DEFAULT_SSH_PORT, ip=self.get_ip(),
+                control_path=self.ssh_control_path
             )
         except NotImplementedError:
             # Fall back to SSH forward mode if fail to get bridge IP
-            runner = SSHCmdRunner(cmdarr, ssh_id_key, self.ssh_forward_port)
+            runner = SSHCmdRunner(cmdarr, ssh_id_key, self.ssh_forward_port,
+                                  control_path=self.ssh_control_path)
 
         if no_wait:
             runner.runnowait()
@@ -225,16 +247,32 @@ class VMGuest:
         return runner
 
     def wait_for_ssh_ready(
-        self, timeout=BOOT_TIMEOUT, check_interval=DEFAULT_CHECK_INTERVAL
+        self, timeout=BOOT_TIMEOUT, check_interval=DEFAULT_CHECK_INTERVAL,
+        strategy="linear"
     ):
         """
         Wait for the port of forwarded SSH ready until timeout
+
+        The "linear" strategy probes every check_interval seconds. The "expo"
+        strategy probes with exponential backoff from 50ms up to 1s, and
+        fails fast if the connection is refused for SSH_REFUSED_TIMEOUT
+        seconds in a row.
         @return True is ready, False is timeout
         """
+        if strategy not in ("linear", "expo"):
+            raise ValueError(f"Unknown strategy {strategy}")
 
         tstart = time.time()
         tnow = time.time()
         ssh_ok = False
+        retries = 0
+        refused_since = None
+
+        def _delay():
+            if strategy == "linear":
+                return check_interval
+            return min(SSH_BACKOFF_MAX,
+                       SSH_BACKOFF_BASE * SSH_BACKOFF_FACTOR ** retries)
 
         LOG.debug("Checking if guest (%s) is live on SSH", self.name)
 
@@ -248,6 +286,8 @@ class VMGuest:
                 ssh_port = DEFAULT_SSH_PORT
                 if ssh_ip is None:
                     LOG.error("Fail to get IP address, ARP is not ready yet")
+                    time.sleep(_delay())
+                    retries += 1
                     tnow = time.time()
                     continue
             except NotImplementedError:
@@ -258,20 +298,30 @@ class VMGuest:
                     "No IP allocated for %s, using %s:%s", self.name, ssh_ip, ssh_port
                 )
 
-            assert ssh_port is not None and ssh_ip is not None
+            if ssh_port is None or ssh_ip is None:
+                raise RuntimeError(f"No SSH address for guest {self.name}")
 
             # Open SSH socket
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(timeout)
+            sock.settimeout(min(timeout, SSH_PROBE_TIMEOUT))
             retcode = sock.connect_ex((ssh_ip, ssh_port))
             if retcode != 0:
-                LOG.error(
+                LOG.debug(
                     "Fail to connect SSH for guest %s, connect error: %d",
                     self.name,
                     retcode,
                 )
                 sock.close()
-                time.sleep(check_interval)
+                if retcode != errno.ECONNREFUSED:
+                    refused_since = None
+                elif refused_since is None:
+                    refused_since = time.time()
+                elif strategy == "expo" and \
+                        time.time() - refused_since > SSH_REFUSED_TIMEOUT:
+                    LOG.error("SSH of guest %s keeps refusing connection", self.name)
+                    return False
+                time.sleep(_delay())
+                retries += 1
                 tnow = time.time()
                 continue
 
@@ -313,12 +363,60 @@ class VMGuest:
         LOG.error("SSH connect timeout!")
         return False
 
+    def _is_ssh_port_open(self):
+        """
+        Check whether the SSH port of guest accepts connection. The cached IP
+        is used, it does not change while the guest goes down.
+        """
+        try:
+            ssh_ip = self.get_ip()
+            ssh_port = DEFAULT_SSH_PORT
+        except NotImplementedError:
+            ssh_ip = LOOPBACK
+            ssh_port = self.ssh_forward_port
+        if ssh_ip is None:
+            return False
+
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.settimeout(1)
+            return sock.connect_ex((ssh_ip, ssh_port)) == 0
+
+    def wait_for_reboot(self, timeout=BOOT_TIMEOUT, down_timeout=30,
+                        check_interval=0.05):
+        """
+        Wait for the guest going down then SSH ready again after a reboot is
+        requested. Polling the SSH port until it is closed replaces a fixed
+        sleep, so the wait ends as soon as the guest is back.
+        @return True is ready, False is timeout or the guest never went down
+        """
+        tstart = time.monotonic()
+        deadline = tstart + down_timeout
+        while self._is_ssh_port_open():
+            if time.monotonic() >= deadline:
+                LOG.error("SSH of guest %s did not go down in %d seconds",
+                          self.name, down_timeout)
+                return False
+            time.sleep(check_interval)
+
+        remaining = timeout - (time.monotonic() - tstart)
+        return self.wait_for_ssh_ready(timeout=max(remaining, 0))
+
+    def define_async(self, executor):
+        """
+        Define VM via VMM operator in executor, so the image can be prepared
+        meanwhile. create() waits for the define to complete.
+        """
+        LOG.debug("+ Define guest %s", self.name)
+        self._define_future = executor.submit(self.vmm.define)
+
     def create(self, stop_at_begining=True):
         """
         Create VM via VMM operator
         """
         LOG.debug("+ Create guest %s", self.name)
-        assert self.vmm is not None
+        if self._define_future is not None:
+            future, self._define_future = self._define_future, None
+            future.result()
         self.vmm.create(stop_at_begining)
 
     def start(self):
@@ -326,7 +424,6 @@ class VMGuest:
         Start VM via VMM operator
         """
         LOG.debug("+ Start guest %s", self.name)
-        assert self.vmm is not None
         self.vmm.start()
 
     def suspend(self):
@@ -334,7 +431,6 @@ class VMGuest:
         Suspend VM
         """
         LOG.debug("+ Suspend guest %s", self.name)
-        assert self.vmm is not None
         self.vmm.suspend()
 
     def resume(self):
@@ -342,7 +438,6 @@ class VMGuest:
         Resume VM
         """
         LOG.debug("+ Resume guest %s", self.name)
-        assert self.vmm is not None
         self.vmm.resume()
 
     def shutdown(self, mode=None):
@@ -350,7 +445,6 @@ class VMGuest:
         Shutdown a VM
         """
         LOG.debug("+ Shutdown guest %s", self.name)
-        assert self.vmm is not None
         if mode is None:
             self.vmm.shutdown()
         else:
@@ -361,6 +455,13 @@ class VMGuest:
         Destroy VM Guest
         """
         LOG.debug("+ Destroy guest %s", self.name)
+        # Let a pending define finish, or it would leave the domain behind
+        if self._define_future is not None:
+            future, self._define_future = self._define_future, None
+            future.exception()
+        # The guest goes away without closing the connection, a master kept
+        # on it would hang the next command
+        SSHCmdRunner.close_master(self.ssh_control_path)
         self.vmm.destroy(is_undefined=is_undefined)
         if delete_image:
             self.image.destroy()
@@ -372,21 +473,20 @@ class VMGuest:
         Remove VM guest
         """
         LOG.debug("+ Reboot guest %s", self.name)
-        assert self.vmm is not None
         self.vmm.reboot()
 
     def state(self):
         """
         Get VM state
         """
-        assert self.vmm is not None
         return self.vmm.state()
 
     def vtpm_state(self):
         """
         Get vTPM TD state
         """
-        assert self.has_vtpm is True
+        if self.has_vtpm is not True:
+            raise RuntimeError(f"{self.name} has no vTPM")
         dom, _ = self.get_vtpm_td_dom()
         state, _ = dom.state()
         if state == libvirt.VIR_DOMAIN_RUNNING:
@@ -399,18 +499,12 @@ class VMGuest:
             return VM_STATE_SHUTDOWN
         return None
 
-    def wait_for_state(self, state, timeout=20):
+    def wait_for_state(self, state, timeout=20, min_stable=0):
         """
-        Wait for VM state to be given value until timeout
+        Wait for VM state to be given value until timeout, and to stay in it
+        for min_stable seconds if given
         """
-        count = 0
-        while count < timeout:
-            assert self.vmm.state() is not None
-            if self.vmm.state() == state:
-                return True
-            time.sleep(1)
-            count += 1
-        return False
+        return self.vmm.wait_for_state(state, timeout, min_stable)
 
     def get_vtpm_td_dom(self):
         """
@@ -463,11 +557,16 @@ class VMGuestFactory:
 
     def __init__(self, vm_mother_image, vm_kernel, part=None):
         self.vms = {}
+        # new_vm() may be called from several threads
+        self._lock = threading.Lock()
         if part is None:
             part = {"root": "/dev/sda3", "efi": "/dev/sda2"}
         self._mother_image = VMImage(vm_mother_image, part["root"], part["efi"])
         self._vm_kernel = vm_kernel
         self._keep_issue_vm = False
+        self._last_time = None
+        # Runs the domain defines of new_vm(prepare_async=True)
+        self._executor = ThreadPoolExecutor(max_workers=4)
 
     def new_vm(
         self,
@@ -498,10 +597,14 @@ class VMGuestFactory:
         vtpm_log=None,
         hugepage_path=None,
         driver=None,
-        mem_numa=None
+        mem_numa=None,
+        prepare_async=False
     ):
         """
         Create a VM.
+
+        If prepare_async is True, the VM is defined in background while the
+        caller prepares its image, create() then only starts it.
         """
 
         if hugepage_size is None:
@@ -509,7 +612,8 @@ class VMGuestFactory:
 
         # UPM 2M hugepage requires hugepage_path for TD
         if hugepages is True and vmtype in [VM_TYPE_TD, VM_TYPE_TD_PERF]:
-            assert hugepage_path is not None, "Please set hugepage_path"
+            if hugepage_path is None:
+                raise ValueError("Please set hugepage_path")
 
         # default io mode is native
         if io_mode is None:
@@ -521,7 +625,12 @@ class VMGuestFactory:
 
         vm_id = str(uuid.uuid4())
         user_name = getpass.getuser()
-        current_time = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S-%f")
+        with self._lock:
+            # Keep the time based VM names unique across threads
+            current_time = self._last_time
+            while current_time == self._last_time:
+                current_time = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S-%f")
+            self._last_time = current_time
         vm_name = f"{vmtype}-{user_name}-{current_time}"
 
         # vTPM BIOS path and vTPM TD log
@@ -578,11 +687,14 @@ class VMGuestFactory:
             mem_numa=mem_numa
         )
 
-        self.vms[vm_name] = inst
+        with self._lock:
+            self.vms[vm_name] = inst
 
         if auto_start:
             inst.create()
             inst.start()
+        elif prepare_async:
+            inst.define_async(self._executor)
 
         return inst
 
@@ -592,21 +704,48 @@ class VMGuestFactory:
         """
         if not self._keep_issue_vm:
             inst.destroy(delete_image=True, delete_log=True)
-            if inst.name in self.vms:
-                del self.vms[inst.name]
+            with self._lock:
+                self.vms.pop(inst.name, None)
         else:
             if not inst.keep:
                 inst.destroy(delete_image=True, delete_log=True)
-                if inst.name in self.vms:
-                    del self.vms[inst.name]
+                with self._lock:
+                    self.vms.pop(inst.name, None)
 
     def removeall(self):
         """
         Remove all VM instance.
         """
-        for inst in list(self.vms.values()):
+        with self._lock:
+            insts = list(self.vms.values())
+        for inst in insts:
             self.remove(inst)
 
+    @staticmethod
+    def prepare_base_image(image_path, pubkey_file):
+        """
+        Inject the SSH public key into the mother image once, so the VMs cloned
+        from it do not need to customize their own image.
+
+        A ".key_injected" file next to the image records the hash of the
+        injected key. The injection is skipped if the recorded key matches and
+        the image was not replaced after the injection.
+        """
+        with open(pubkey_file, "rb") as fobj:
+            digest = hashlib.sha256(fobj.read()).hexdigest()
+
+        sentinel = image_path + ".key_injected"
+        if os.path.exists(sentinel) and \
+                os.path.getmtime(sentinel) >= os.path.getmtime(image_path):
+            with open(sentinel, "r", encoding="utf8") as fobj:
+                if fobj.read().strip() == digest:
+                    return
+
+        LOG.info("Inject SSH key into base image %s", image_path)
+        VMImage(image_path).inject_root_ssh_key(pubkey_file)
+        with open(sentinel, "w", encoding="utf8") as fobj:
+            fobj.write(digest)
+
     def set_keep_issue_vm(self, keep_issue_vm):
         """
         Set value for keep_issue_vm. If it's true, do NOT destroy unhealthy VMs
@@ -615,3 +754,68 @@ class VMGuestFactory:
 
     def __del__(self):
         self.removeall()
+
+
+class VMGuestPool:
+
+    """
+    Reuse the VMs of a factory across tests. A released VM is stopped but its
+    domain stays defined, so the next acquire() of the same VM type starts it
+    again instead of cloning the image and defining a new domain. The last
+    released VM is reused first.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._idle = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def acquire(self, vmtype):
+        """
+        Get a started VM of given type, a new one is created if none is idle.
+        """
+        with self._lock:
+            idle = self._idle[vmtype]
+            inst = idle.pop() if idle else None
+        if inst is None:
+            LOG.debug("+ Create pooled %s guest", vmtype)
+            return self.factory.new_vm(vmtype, auto_start=True)
+        LOG.debug("+ Reuse pooled guest %s", inst.name)
+        inst.start()
+        return inst
+
+    def release(self, inst, reuse=True):
+        """
+        Stop the VM and keep it for the next acquire(). If reuse is False, for
+        example when the test using it failed, or the VM had a failed SSH
+        command, it is removed by the factory instead.
+        """
+        if not reuse or inst.keep:
+            LOG.debug("+ Remove pooled guest %s", inst.name)
+            self.factory.remove(inst)
+            return
+        inst.destroy(is_undefined=False)
+        with self._lock:
+            self._idle[inst.vmtype].append(inst)
+
+    @contextlib.contextmanager
+    def guest(self, vmtype):
+        """
+        Acquire a VM of given type for a with block. It is released when the
+        block exits, or removed if the block raises.
+        """
+        inst = self.acquire(vmtype)
+        try:
+            yield inst
+        except BaseException:
+            self.release(inst, reuse=False)
+            raise
+        self.release(inst)
+
+    def removeall(self):
+        """
+        Remove all VMs of the pool.
+        """
+        with self._lock:
+            self._idle.clear()
+        self.factory.removeall()
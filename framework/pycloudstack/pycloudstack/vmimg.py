@@ -36,11 +36,14 @@ class VMImage:
     def copy_in(self, localpath, remotedir):
         """
         Copy local file/directory to remote dir in rootfs partition within Image.
+
+        localpath can be a list to copy several files with one virt-copy-in.
         """
-        LOG.info("- COPY [H -> G]: %s ==> %s", localpath, remotedir)
-        # Enable root remote login
+        if isinstance(localpath, str):
+            localpath = [localpath]
+        LOG.info("- COPY [H -> G]: %s ==> %s", " ".join(localpath), remotedir)
         runner = NativeCmdRunner(
-            ["virt-copy-in", "-a", self._filepath, localpath, remotedir])
+            ["virt-copy-in", "-a", self._filepath] + localpath + [remotedir])
         runner.runwait()
         assert runner.retcode == 0
 
@@ -56,6 +59,21 @@ class VMImage:
         runner.runwait()
         assert runner.retcode == 0
 
+    def customize(self, commands=None, copy_in=None, remotedir="/root/"):
+        """
+        Copy local files into remotedir and run the commands within Image
+        with one virt-customize, so only one appliance is launched.
+        """
+        cmdarr = ["virt-customize", "-a", self._filepath]
+        for localpath in copy_in or []:
+            LOG.info("- COPY [H -> G]: %s ==> %s", localpath, remotedir)
+            cmdarr += ["--copy-in", f"{localpath}:{remotedir}"]
+        for command in commands or []:
+            cmdarr += ["--run-command", command]
+        runner = NativeCmdRunner(cmdarr)
+        runner.runwait()
+        assert runner.retcode == 0
+
     def inject_root_ssh_key(self, pubkey_file=None):
         """
         Inject the test SSH public key into vm image for root account.
@@ -11,10 +11,12 @@ VMM(Virtual Machine Manager) provide two types managers: Libvirt and Qemu
 
 """
 import os
-import re
 import logging
 import time
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import xml.etree.ElementTree as ET
 import libvirt
 import libvirt_qemu
 from .cmdrunner import NativeCmdRunner
@@ -46,6 +48,120 @@ __author__ = "cpio"
 LOG = logging.getLogger(__name__)
 
 ARP_INTERVAL = 120
+ARP_TABLE = "/proc/net/arp"
+
+# All VMMLibvirt instances share one libvirt connection, it is opened by the
+# first reference and closed when the last reference is released, see
+# acquire_connection() and release_connection().
+_SHARED_CONN = None
+_CONN_REFS = 0
+_CONN_LOCK = threading.RLock()
+_EVENT_LOOP_THREAD = None
+
+# Map libvirt lifecycle events to the VM state they lead to, other events
+# leave the state unknown so it is queried from libvirtd again.
+_LIFECYCLE_STATES = {
+    libvirt.VIR_DOMAIN_EVENT_STARTED: VM_STATE_RUNNING,
+    libvirt.VIR_DOMAIN_EVENT_RESUMED: VM_STATE_RUNNING,
+    libvirt.VIR_DOMAIN_EVENT_SUSPENDED: VM_STATE_PAUSE,
+    libvirt.VIR_DOMAIN_EVENT_SHUTDOWN: VM_STATE_SHUTDOWN_IN_PROGRESS,
+    libvirt.VIR_DOMAIN_EVENT_STOPPED: VM_STATE_SHUTDOWN,
+}
+
+
+def _run_event_loop():
+    while True:
+        libvirt.virEventRunDefaultImpl()
+
+
+def start_event_loop():
+    """
+    Register the default libvirt event implementation and run it in a daemon
+    thread, so the lifecycle events of domains are delivered to
+    VMMLibvirt.wait_for_state(). It must be called before the connection is
+    opened, it is done on the first connection if not called earlier.
+    """
+    global _EVENT_LOOP_THREAD  # pylint: disable=global-statement
+    if _EVENT_LOOP_THREAD is not None:
+        return
+    libvirt.virEventRegisterDefaultImpl()
+    _EVENT_LOOP_THREAD = threading.Thread(
+        target=_run_event_loop, name="libvirt-event-loop", daemon=True
+    )
+    _EVENT_LOOP_THREAD.start()
+
+
+def acquire_connection():
+    """
+    Get the shared libvirt connection and take a reference on it, it is
+    opened if not yet. The caller must call release_connection() once done.
+    """
+    global _SHARED_CONN, _CONN_REFS  # pylint: disable=global-statement
+    with _CONN_LOCK:
+        if _SHARED_CONN is None:
+            LOG.debug("Create libvirt connection")
+            start_event_loop()
+            try:
+                _SHARED_CONN = libvirt.open("qemu:///system")
+            except libvirt.libvirtError as error:
+                raise RuntimeError(
+                    "Fail to connect libvirt, please make sure the libvirt "
+                    "is started and current user in libvirt group"
+                ) from error
+        _CONN_REFS += 1
+        return _SHARED_CONN
+
+
+def release_connection():
+    """
+    Release a reference on the shared libvirt connection, it is closed when
+    the last reference is released.
+    """
+    global _SHARED_CONN, _CONN_REFS  # pylint: disable=global-statement
+    with _CONN_LOCK:
+        _CONN_REFS -= 1
+        if _CONN_REFS == 0 and _SHARED_CONN is not None:
+            LOG.debug("Close libvirt connection")
+            _SHARED_CONN.close()
+            _SHARED_CONN = None
+
+
+def _read_arp_table():
+    """
+    Read the (ip, mac) pairs from the kernel ARP table directly instead of
+    forking the arp command and regex parsing its output.
+    """
+    entries = []
+    try:
+        with open(ARP_TABLE, encoding="utf-8") as fobj:
+            lines = fobj.read().splitlines()[1:]
+    except (OSError, IOError):
+        LOG.warning("Fail to read the ARP table %s", ARP_TABLE)
+        return entries
+    for line in lines:
+        # IP address, HW type, Flags, HW address, Mask, Device
+        fields = line.split()
+        if len(fields) < 4 or fields[2] == "0x0":
+            continue
+        entries.append((fields[0], fields[3].lower()))
+    return entries
+
+
+def bulk_create(vmms, stop_at_begining=True, max_workers=8):
+    """
+    Create several VMs concurrently. The libvirt calls of different domains
+    are independent, so libvirtd can set them up in parallel.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda vmm: vmm.create(stop_at_begining), vmms))
+
+
+def bulk_destroy(vmms, is_undefined=True, max_workers=8):
+    """
+    Destroy several VMs concurrently.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda vmm: vmm.destroy(is_undefined), vmms))
 
 
 class VMMBase:
@@ -58,6 +174,12 @@ class VMMBase:
     def __init__(self, vminst):
         self.vminst = vminst
 
+    def define(self):
+        """
+        Define a VM without starting it. The VMM without a separate define
+        step does everything in create().
+        """
+
     def create(self, stop_at_begining=True):
         """
         Create a VM.
@@ -109,6 +231,28 @@ class VMMBase:
         """
         raise NotImplementedError
 
+    def wait_for_state(self, state, timeout=20, min_stable=0):
+        """
+        Wait for VM state to be given value until timeout. If min_stable is
+        given, the VM must also stay in the state for min_stable seconds.
+        """
+        deadline = time.time() + timeout
+        stable_since = None
+        while True:
+            current = self.state()
+            if current is None:
+                raise RuntimeError(f"Fail to get the state of {self.vminst.name}")
+            now = time.time()
+            if current != state:
+                stable_since = None
+            elif stable_since is None:
+                stable_since = now
+            if stable_since is not None and now - stable_since >= min_stable:
+                return True
+            if now >= deadline:
+                return False
+            time.sleep(min(1, min_stable) if min_stable > 0 else 1)
+
     def get_ip(self, force_refresh=False):
         """
         Get VM available IP on virtual or physical bridge
@@ -150,15 +294,38 @@ class VMMLibvirt(VMMBase):
         VM_TYPE_LEGACY_PERF: "legacy-base-perf",
     }
 
+    # TD cpu parameters keyed by (low base frequency, tsx disabled,
+    # tsc-deadline disabled)
+    _TD_CPU_PARAMS = {
+        (lowfreq, no_tsx, no_tsc): "host,-shstk,-kvm-steal-time,pmu=off"
+        + (",tsc-freq=1000000000" if lowfreq else "")
+        + (",-hle,-rtm" if no_tsx else "")
+        + (",-tsc-deadline" if no_tsc else "")
+        for lowfreq in (False, True)
+        for no_tsx in (False, True)
+        for no_tsc in (False, True)
+    }
+
+    # Constant guest agent commands, encoded once
+    _QGA_SHUTDOWN = json.dumps({"execute": "guest-shutdown"})
+    _QGA_REBOOT = json.dumps(
+        {"execute": "guest-shutdown", "arguments": {"mode": "reboot"}})
+
     def __init__(self, vminst):
         super().__init__(vminst)
         self._virt_conn = self._connect_virt()
-        assert self._virt_conn is not None, (
-            "Fail to connect libvirt, please make"
-            "sure the libvirt is started and current user in libvirt group"
-        )
         self._xml = self._prepare_domain_xml()
         self._ip = None
+        # The leased address already pinged to populate the ARP table
+        self._pinged_ip = None
+        self._dom = None
+        # The XML of the last define(), create() skips the define if unchanged
+        self._defined_xml = None
+        self._xml_tree = None
+        # VM state tracked from lifecycle events, None means unknown
+        self._state = None
+        self._state_cond = threading.Condition()
+        self._event_cb_id = None
 
     def _prepare_domain_xml(self):
         xmlobj = VirtXml.clone(self._TEMPLATE[self.vminst.vmtype], self.vminst.name)
@@ -247,43 +414,54 @@ class VMMLibvirt(VMMBase):
             if self.vminst.hugepage_path is not None:
                 xmlobj.set_hugepage_path(self.vminst.hugepage_path)
 
-            param_cpu = ""
-            if DUT.get_cpu_base_freq() < 1000000:
-                param_cpu = "host,-shstk,-kvm-steal-time,pmu=off,tsc-freq=1000000000"
-            else:
-                param_cpu = "host,-shstk,-kvm-steal-time,pmu=off"
-
-            if self.vminst.tsx is False:
-                param_cpu += ",-hle,-rtm"
-            if self.vminst.tsc is False:
-                param_cpu += ",-tsc-deadline"
-
-            xmlobj.set_cpu_params(param_cpu)
+            lowfreq = DUT.get_cpu_base_freq() < 1000000
+            xmlobj.set_cpu_params(self._TD_CPU_PARAMS[
+                (lowfreq, self.vminst.tsx is False, self.vminst.tsc is False)])
 
     def _connect_virt(self):
-        LOG.debug("Create libvirt connection")
-        try:
-            self._virt_conn = libvirt.open("qemu:///system")
-            return self._virt_conn
-        except libvirt.libvirtError:
-            LOG.error(
-                "Fail to connect libvirt, please make sure current user in libvirt group"
-            )
-            assert False
-        return None
+        self._virt_conn = acquire_connection()
+        return self._virt_conn
 
     def _close_virt(self):
-        LOG.debug("Close libvirt connection")
-        if self._virt_conn is not None:
-            self._virt_conn.close()
+        with _CONN_LOCK:
+            if getattr(self, "_virt_conn", None) is None:
+                return
+            self._deregister_lifecycle_event()
+            self._virt_conn = None
+            self._dom = None
+            release_connection()
 
     def _get_domain(self):
-        assert self._virt_conn is not None
+        """
+        Get the domain handle, only look it up via libvirtd when the cached
+        handle is missing or no longer valid.
+        """
+        if self._dom is not None:
+            try:
+                self._dom.UUIDString()
+                return self._dom
+            except libvirt.libvirtError:
+                self._dom = None
+
         try:
-            return self._virt_conn.lookupByUUIDString(self.vminst.vmid)
+            self._dom = self._virt_conn.lookupByUUIDString(self.vminst.vmid)
         except libvirt.libvirtError:
             LOG.warning("Fail to get the domain %s", self.vminst.vmid)
             return None
+        return self._dom
+
+    def _get_xml_tree(self, refresh=False):
+        """
+        Get the parsed live domain XML. The XML is fetched from libvirtd and
+        parsed only once, then reused until refresh is requested or the
+        domain is created/destroyed.
+        """
+        if self._xml_tree is None or refresh:
+            dom = self._get_domain()
+            if dom is None:
+                return None
+            self._xml_tree = ET.fromstring(dom.XMLDesc(0))
+        return self._xml_tree
 
     def __del__(self):
         self._close_virt()
@@ -292,7 +470,6 @@ class VMMLibvirt(VMMBase):
         """
         Get a domain from specific UUID string
         """
-        assert self._virt_conn is not None
         try:
             return self._virt_conn.lookupByUUIDString(domain_uuid)
         except libvirt.libvirtError:
@@ -303,9 +480,10 @@ class VMMLibvirt(VMMBase):
         """
         Get vtpm ID
         """
-        dom = self._get_domain()
-        vtpm_id = re.search("<vtpmid>(.*)</vtpmid>", dom.XMLDesc()).group(1)
-        return vtpm_id
+        tree = self._get_xml_tree()
+        if tree is None:
+            return None
+        return tree.findtext(".//vtpmid")
 
     def create(self, stop_at_begining=True):
         """
@@ -314,10 +492,60 @@ class VMMLibvirt(VMMBase):
         If stop_at_begining is True, then the VM will paused/stopped
         after creation, until execute start() explicity.
         """
-        assert self._virt_conn is not None
+        if self._dom is None or self._defined_xml != self._xml.tostring():
+            self.define()
+        self._dom.create()
+        self._invalidate_state()
+
+    def define(self):
+        """
+        Define the domain from the virt XML without starting it.
+        """
         self._xml.dump()
-        domain = self._virt_conn.defineXML(self._xml.tostring())
-        domain.create()
+        # Write the virt XML for debugging once, the setters do not write it
+        self._xml.save()
+        self._xml_tree = None
+        self._defined_xml = self._xml.tostring()
+        self._dom = self._virt_conn.defineXML(self._defined_xml)
+        self._register_lifecycle_event()
+
+    def _register_lifecycle_event(self):
+        """
+        Track the VM state from libvirt lifecycle events, so state() and
+        wait_for_state() do not need to query libvirtd.
+        """
+        if self._event_cb_id is not None:
+            return
+        try:
+            self._event_cb_id = self._virt_conn.domainEventRegisterAny(
+                self._dom, libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+                self._on_lifecycle_event, None)
+        except libvirt.libvirtError:
+            LOG.warning("Fail to register lifecycle event for %s", self._xml.name)
+
+    @property
+    def event_tracked(self):
+        """
+        Whether the VM state is tracked from libvirt lifecycle events
+        """
+        return self._event_cb_id is not None
+
+    def _deregister_lifecycle_event(self):
+        if getattr(self, "_event_cb_id", None) is None:
+            return
+        try:
+            self._virt_conn.domainEventDeregisterAny(self._event_cb_id)
+        except libvirt.libvirtError:
+            LOG.warning("Fail to deregister lifecycle event for %s", self._xml.name)
+        self._event_cb_id = None
+        with self._state_cond:
+            self._state = None
+
+    # pylint: disable=unused-argument,too-many-arguments
+    def _on_lifecycle_event(self, conn, dom, event, detail, opaque):
+        with self._state_cond:
+            self._state = _LIFECYCLE_STATES.get(event)
+            self._state_cond.notify_all()
 
     def destroy(self, is_undefined=True):
         """
@@ -331,11 +559,13 @@ class VMMLibvirt(VMMBase):
             LOG.warning("Unable to find the domain %s", self.vminst.vmid)
         else:
             if dom is not None:
+                # Destroy unconditionally instead of asking isActive() first,
+                # a shutoff domain just reports an invalid operation
                 try:
-                    if dom.isActive():
-                        dom.destroy()
-                except libvirt.libvirtError:
-                    LOG.warning("Fail to delete the domain %s", self._xml.name)
+                    dom.destroyFlags(libvirt.VIR_DOMAIN_DESTROY_DEFAULT)
+                except libvirt.libvirtError as error:
+                    if error.get_error_code() != libvirt.VIR_ERR_OPERATION_INVALID:
+                        LOG.warning("Fail to delete the domain %s", self._xml.name)
 
                 if is_undefined:
                     try:
@@ -343,6 +573,11 @@ class VMMLibvirt(VMMBase):
                     except libvirt.libvirtError:
                         LOG.warning("Unable to undefine the domain %s", self._xml.name)
 
+        # The domain is gone or stopped, force a new lookup next time
+        self._deregister_lifecycle_event()
+        self._dom = None
+        self._xml_tree = None
+
         # Delete XML file
         if os.path.exists(self._xml.filepath):
             try:
@@ -365,27 +600,33 @@ class VMMLibvirt(VMMBase):
         """
         Start a VM if VM is not started.
         """
-        if self.is_shutoff():
-            dom = self._get_domain()
+        dom, state = self._state_fast()
+        # A domain kept defined by destroy(is_undefined=False) lost its
+        # lifecycle callback, track its state again before it starts
+        self._register_lifecycle_event()
+        if state == libvirt.VIR_DOMAIN_SHUTOFF:
             dom.create()
-        else:
-            self.resume()
+        elif state != libvirt.VIR_DOMAIN_RUNNING:
+            dom.resume()
+        self._invalidate_state()
 
     def suspend(self):
         """
         Suspend a VM if VM is running
         """
-        dom = self._get_domain()
-        if self.is_running():
+        dom, state = self._state_fast()
+        if state == libvirt.VIR_DOMAIN_RUNNING:
             dom.suspend()
+        self._invalidate_state()
 
     def resume(self):
         """
         Resume a VM if VM is stopped/paused
         """
-        dom = self._get_domain()
-        if not self.is_running():
+        dom, state = self._state_fast()
+        if state != libvirt.VIR_DOMAIN_RUNNING:
             dom.resume()
+        self._invalidate_state()
 
     def reboot(self):
         """
@@ -393,6 +634,7 @@ class VMMLibvirt(VMMBase):
         """
         dom = self._get_domain()
         dom.reboot()
+        self._invalidate_state()
 
     def shutdown(self, mode=None):
         """
@@ -407,30 +649,80 @@ class VMMLibvirt(VMMBase):
             dom.shutdownFlags(libvirt.VIR_DOMAIN_SHUTDOWN_ACPI_POWER_BTN)
         elif mode == "agent":
             dom.shutdownFlags(libvirt.VIR_DOMAIN_SHUTDOWN_GUEST_AGENT)
+        self._invalidate_state()
 
-    def is_running(self):
+    def _invalidate_state(self):
         """
-        Check whether a VM is running
+        Forget the tracked state after an operation of this object, so the
+        next state() queries libvirtd once instead of returning the state from
+        before the operation until its lifecycle event arrives.
+        """
+        with self._state_cond:
+            self._state = None
+
+    def _state_fast(self):
+        """
+        Get the domain handle together with its raw libvirt state, so callers
+        branch on a single state query.
         """
         dom = self._get_domain()
         state, _ = dom.state()
+        return dom, state
+
+    def is_running(self):
+        """
+        Check whether a VM is running
+        """
+        _, state = self._state_fast()
         return state == libvirt.VIR_DOMAIN_RUNNING
 
     def is_shutoff(self):
         """
         Check whether a VM is shutoff
         """
-        dom = self._get_domain()
-        state, _ = dom.state()
+        _, state = self._state_fast()
         return state == libvirt.VIR_DOMAIN_SHUTOFF
 
     def state(self):
         """
-        Get VM state
-        """
-        dom = self._get_domain()
-
-        state, _ = dom.state()
+        Get VM state, use the one tracked from lifecycle events if possible
+        """
+        if self._event_cb_id is None:
+            return self._poll_state()
+        with self._state_cond:
+            if self._state is None:
+                self._state = self._poll_state()
+            return self._state
+
+    def wait_for_state(self, state, timeout=20, min_stable=0):
+        """
+        Wait for VM state to be given value until timeout, block on lifecycle
+        events instead of polling libvirtd. If min_stable is given, the VM
+        must also stay in the state for min_stable seconds.
+        """
+        if self._event_cb_id is None:
+            return super().wait_for_state(state, timeout, min_stable)
+        deadline = time.time() + timeout
+        with self._state_cond:
+            while True:
+                while self.state() != state:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        # Confirm with libvirtd in case any event was missed
+                        self._state = self._poll_state()
+                        return self._state == state
+                    self._state_cond.wait(remaining)
+                # Any lifecycle event wakes up the wait, go back to waiting
+                # for the state if the VM left it
+                stable_until = time.time() + min_stable
+                while self.state() == state:
+                    remaining = stable_until - time.time()
+                    if remaining <= 0:
+                        return True
+                    self._state_cond.wait(remaining)
+
+    def _poll_state(self):
+        _, state = self._state_fast()
         if state == libvirt.VIR_DOMAIN_RUNNING:
             return VM_STATE_RUNNING
         if state == libvirt.VIR_DOMAIN_PAUSED:
@@ -450,30 +742,32 @@ class VMMLibvirt(VMMBase):
         """
         if (not force_refresh) and (self._ip is not None):
             return self._ip
+        self._ip = None
 
-        dom = self._get_domain()
-        vm_mac_address = re.search(
-            r"<mac address='([a-zA-Z0-9:]+)'", dom.XMLDesc(0)
-        ).groups()
+        tree = self._get_xml_tree()
+        mac = tree.find(".//interface/mac") if tree is not None else None
+        vm_mac_address = mac.get("address") if mac is not None else None
         if vm_mac_address is None:
             LOG.warning("Could not find the available MAC address for VM")
             return None
 
         tstart = time.time()
         retry = ARP_INTERVAL
+        vm_mac_address = vm_mac_address.lower()
         while retry > 0:
-            runner = NativeCmdRunner(["arp", "-a"], silent=True)
-            runner.runwait()
-
-            for line in runner.stdout:
-                ipaddr = re.search(
-                    r"([0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3})", line
+            # Ping the address leased by libvirt dnsmasq once per lease, so
+            # the ARP table gets populated without waiting for guest traffic
+            lease_ip = self._get_lease_ip(vm_mac_address)
+            if lease_ip is not None and lease_ip != self._pinged_ip:
+                runner = NativeCmdRunner(
+                    ["ping", "-c", "1", "-W", "1", lease_ip], silent=True
                 )
-                macaddr = re.search(r"(\w+:\w+:\w+:\w+:\w+:\w+)", line)
-                if ipaddr is None or macaddr is None:
-                    continue
-                if macaddr.groups(0)[0] == vm_mac_address[0]:
-                    self._ip = ipaddr.groups(0)[0]
+                runner.runwait()
+                self._pinged_ip = lease_ip
+
+            for ipaddr, macaddr in _read_arp_table():
+                if macaddr == vm_mac_address:
+                    self._ip = ipaddr
 
             if self._ip is not None:
                 break
@@ -488,6 +782,27 @@ class VMMLibvirt(VMMBase):
         )
         return self._ip
 
+    def _get_lease_ip(self, mac_address):
+        """
+        Get the IPv4 address libvirt DHCP leased for the given MAC address
+        """
+        dom = self._get_domain()
+        if dom is None:
+            return None
+        try:
+            ifaces = dom.interfaceAddresses(
+                libvirt.VIR_DOMAIN_INTERFACE_ADDRESSES_SRC_LEASE
+            )
+        except libvirt.libvirtError:
+            return None
+        for iface in ifaces.values():
+            if (iface.get("hwaddr") or "").lower() != mac_address:
+                continue
+            for addr in iface.get("addrs") or []:
+                if addr["type"] == libvirt.VIR_IP_ADDR_TYPE_IPV4:
+                    return addr["addr"]
+        return None
+
     def update_kernel_cmdline(self, cmdline):
         """
         Update kernel command line
@@ -506,77 +821,77 @@ class VMMLibvirt(VMMBase):
         """
         raise NotImplementedError
 
-    def _qemu_agent_command(self, cmd):
-        dom = self._get_domain()
+    def _qemu_agent_command(self, cmd, dom=None):
+        if dom is None:
+            dom = self._get_domain()
         return libvirt_qemu.qemuAgentCommand(dom, cmd, 30, 0)
 
+    def _qga(self, execute, arguments=None, dom=None):
+        """
+        Run a QEMU Guest agent command and return the "return" member of the
+        reply. arguments is a dict since some of the keys like "buf-b64" are
+        not valid python identifiers.
+        """
+        cmd = {"execute": execute}
+        if arguments is not None:
+            cmd["arguments"] = arguments
+        reply = json.loads(self._qemu_agent_command(json.dumps(cmd), dom))
+        if "return" not in reply:
+            raise RuntimeError(f"Guest agent command {execute} failed: {reply}")
+        return reply["return"]
+
     def qemu_agent_shutdown(self):
         """
         Shutdown VM using QEMU Guest agent 'guest-shutdown' command.
         """
-        return self._qemu_agent_command('{"execute": "guest-shutdown"}')
+        # The guest agent does not reply to a successful guest-shutdown
+        return self._qemu_agent_command(self._QGA_SHUTDOWN)
 
     def qemu_agent_reboot(self):
         """
         Reboot VM using QEMU Guest agent 'guest-shutdown' command, mode "reboot".
         """
-        return self._qemu_agent_command(
-            '{"execute": "guest-shutdown", "arguments": {"mode": "reboot"}}'
-        )
+        return self._qemu_agent_command(self._QGA_REBOOT)
 
     def qemu_agent_file_write(self, path, content):
         """
         Write to a file within the VM using QEMU Guest commands.
         """
-        # pylint: disable=consider-using-f-string
-        ret = self._qemu_agent_command(
-            '{"execute": "guest-file-open", "arguments":{"path": "%s", "mode": "w+"}}'
-            % path
-        )
-        assert "return" in ret
-        j = json.loads(ret)
-        filedescriptor = j["return"]
-        # pylint: disable=consider-using-f-string
-        ret = self._qemu_agent_command(
-            '{"execute": "guest-file-write", "arguments" : {"handle": %s, "buf-b64": "%s" }}'
-            % (filedescriptor, content)
-        )
-        assert "return" in ret
-        # pylint: disable=consider-using-f-string
-        ret = self._qemu_agent_command(
-            '{"execute": "guest-file-close", "arguments":{"handle": %s }}'
-            % filedescriptor
-        )
-        assert "return" in ret
+        return self.qemu_agent_file_write_many({path: content})
+
+    def qemu_agent_file_write_many(self, files):
+        """
+        Write several files within the VM using QEMU Guest commands, files is
+        a dict of path to base64 encoded content.
+
+        The guest agent only accepts one command per request, so the
+        open/write/close sequence is kept per file but all of them are sent
+        over the same domain handle.
+        """
+        dom = self._get_domain()
+        for path, content in files.items():
+            filedescriptor = self._qga(
+                "guest-file-open", {"path": path, "mode": "w+"}, dom)
+            try:
+                self._qga("guest-file-write",
+                          {"handle": filedescriptor, "buf-b64": content}, dom)
+            finally:
+                self._qga("guest-file-close", {"handle": filedescriptor}, dom)
         return True
 
     def qemu_agent_file_read(self, path):
         """
         Read from a file within the VM using QEMU Guest commands.
         """
-        # pylint: disable=consider-using-f-string
-        ret = self._qemu_agent_command(
-            '{"execute": "guest-file-open", "arguments":{"path": "%s", "mode": "r"}}'
-            % path
-        )
-        assert "return" in ret
-        j = json.loads(ret)
-        filedescriptor = j["return"]
-        # pylint: disable=consider-using-f-string
-        content = self._qemu_agent_command(
-            '{"execute": "guest-file-read", "arguments" : {"handle": %s }}'
-            % filedescriptor
-        )
-        assert "return" in ret
-        # pylint: disable=consider-using-f-string
-        ret = self._qemu_agent_command(
-            '{"execute": "guest-file-close", "arguments": {"handle": %s }}'
-            % filedescriptor
-        )
-        assert "return" in ret
-
-        j = json.loads(content)
-        return j["return"]["buf-b64"]
+        dom = self._get_domain()
+        filedescriptor = self._qga(
+            "guest-file-open", {"path": path, "mode": "r"}, dom)
+        try:
+            content = self._qga(
+                "guest-file-read", {"handle": filedescriptor}, dom)
+        finally:
+            self._qga("guest-file-close", {"handle": filedescriptor}, dom)
+        return content["buf-b64"]
 
 
 class VMMKubeVirt(VMMBase):
@@ -1,6 +1,8 @@
 """
 VM params package manages the several parameters' class for guest VM.
 """
+from collections import OrderedDict
+
 VM_TYPE_EFI = "efi"
 VM_TYPE_LEGACY = "legacy"
 VM_TYPE_TD = "td"
@@ -61,84 +63,118 @@ class KernelCmdline:
         print(cmdobj)
     """
 
+    __slots__ = ("_fields", "_keys", "_cmdline")
+
     def __init__(self, default=DEFAULT_CMDLINE):
-        self._cmdline = default
+        # Ordered fields keyed by the full "key=value" token so that repeated
+        # keys like "console=hvc0 console=tty0" are kept, plus an index from
+        # key to the tokens using it for key based lookups.
+        self._fields = OrderedDict()
+        self._keys = {}
+        self._cmdline = None
+        for token in default.split():
+            self._add_token(token)
 
     def __str__(self):
+        if self._cmdline is None:
+            self._cmdline = " ".join(self._fields)
         return self._cmdline
 
     def __iadd__(self, value):
-        for item in value.split(" "):
-            if item not in self._cmdline.strip().split(' '):
-                self._cmdline += f' {value}'
+        parts = []
+        for item in value.split():
+            if item not in self._fields:
+                self._add_token(item, invalidate=False)
+                parts.append(item)
+        # Extend the cached string instead of re-joining all fields
+        if parts and self._cmdline is not None:
+            self._cmdline = " ".join([self._cmdline] + parts).strip()
         return self
 
+    def _add_token(self, token, invalidate=True):
+        if token in self._fields:
+            return
+        key = token.split('=')[0]
+        self._fields[token] = key
+        self._keys.setdefault(key, []).append(token)
+        if invalidate:
+            self._cmdline = None
+
+    def _remove_token(self, token):
+        key = self._fields.pop(token, None)
+        if key is None:
+            return
+        self._keys[key].remove(token)
+        if len(self._keys[key]) == 0:
+            del self._keys[key]
+        self._cmdline = None
+
     @property
     def field_keys(self):
         """
         The key array for all fields in kernel command line
         """
-        return [item.split('=')[0] for item in self._cmdline.strip().split(' ')]
+        return list(self._fields.values())
 
     def get_value(self, field_key):
         """
         Get the value for given field's key
         """
-        for item in self._cmdline.strip().split(' '):
-            arr = item.split('=')
-            if arr[0] == field_key:
-                if len(arr) > 1:
-                    return arr[1]
+        for token in self._keys.get(field_key, []):
+            arr = token.split('=', 1)
+            if len(arr) > 1:
+                return arr[1]
         return None
 
     def add_field_from_string(self, field_str):
         """
         Add a field from full string include key=value
         """
-        if not self.is_field_exists(field_str):
-            self._cmdline += " " + field_str
+        for token in field_str.split():
+            self._add_token(token)
 
     def add_field(self, key, value=None):
         """
         Add a field from key, value
         """
         if value is None:
-            self._cmdline += " " + key
+            self._add_token(key)
         else:
-            self._cmdline += f" {key}={value}"
+            self._add_token(f"{key}={value}")
 
     def is_field_exists(self, field_str):
         """
         Does the field exist from a complete field string
         """
-        assert field_str is not None
-        return self._cmdline.find(field_str.strip()) != -1
+        if field_str is None:
+            raise ValueError("field_str should not be None")
+        return field_str.strip() in self._fields
 
     def is_field_key_exists(self, field_key):
         """
         Does the field exists from given field key
         """
-        assert field_key is not None
-        return field_key.strip() in self.field_keys
+        if field_key is None:
+            raise ValueError("field_key should not be None")
+        return field_key.strip() in self._keys
 
     def remove_field_from_string(self, field_str):
         """
         Remove field from given full field string
         """
-        assert field_str is not None
-        self._cmdline = self._cmdline.replace(field_str.strip(), '')
+        if field_str is None:
+            raise ValueError("field_str should not be None")
+        for token in field_str.split():
+            self._remove_token(token)
 
     def remove_fields(self, key):
         """
         Remove all fields from given key
         """
-        assert key is not None
-        items = self._cmdline.strip().split(' ')
-        retval = ''
-        for item in items:
-            if item.split('=')[0] != key.strip():
-                retval += ' ' + item
-        self._cmdline = retval
+        if key is None:
+            raise ValueError("key should not be None")
+        for token in list(self._keys.get(key.strip(), [])):
+            self._remove_token(token)
 
 
 class VMSpec:
@@ -146,21 +182,18 @@ class VMSpec:
     CPU Topology parameter for VM configure.
     """
 
+    __slots__ = ("sockets", "cores", "threads", "vcpus", "memsize")
+
     def __init__(self, sockets=1, cores=4, threads=1, memsize=None):
         self.sockets = sockets
         self.cores = cores
         self.threads = threads
+        # Total number of vcpu
+        self.vcpus = sockets * cores * threads
         self.memsize = memsize
         if memsize is None:
             self.memsize = self.vcpus * 4 * 1024 * 1024
 
-    @property
-    def vcpus(self):
-        """
-        Total number of vcpu
-        """
-        return self.sockets * self.cores * self.threads
-
     def is_numa(self):
         """
         Is the NUMA enabled
@@ -201,6 +234,8 @@ class SGXVMSpec(VMSpec):
     SGX specific configurations
     """
 
+    __slots__ = ("epc",)
+
     def __init__(self, sockets=1, cores=4, threads=1, memsize=None, epc=None):
         """
         The EPC configuration should be like:
@@ -213,5 +248,6 @@ class SGXVMSpec(VMSpec):
                    {'size': '28M', 'prealloc': False, 'node': 1}]
         """
         super().__init__(sockets, cores, threads, memsize)
-        assert epc is not None and len(epc) > 0
+        if not epc:
+            raise ValueError("epc should be a non-empty list")
         self.epc = epc
@@ -9,6 +9,7 @@ HOST=$(cat /proc/sys/kernel/hostname)
 GUEST=ubuntu
 SUITE="nosuite"
 KEEP_ISSUE_VM=false
+WORKERS="auto"
 CASES=()
 
 usage() {
@@ -17,6 +18,8 @@ Usage: $(basename "$0") [OPTION]...
   -s Run all tests
   -c Multiple options for individual cases file like "-c tests/test_vm_coexist.py"
   -k Keep unhealthy VM
+  -n Number of parallel workers via pytest-xdist, like "-n 4" or "-n 0" to run
+     serially, default is "auto" which leaves two CPUs for libvirtd and QEMU
   -g Choice Guest OS type from ["rhel", "centosstream", "ubuntu"], default is Ubuntu
   -h Show this
 EOM
@@ -25,11 +28,12 @@ EOM
 
 process_args() {
 
-    while getopts "c:g:skh" opt; do
+    while getopts "c:g:n:skh" opt; do
         case $opt in
         s) SUITE="all";;
         c) CASES+=("$OPTARG");;
         k) KEEP_ISSUE_VM=true;;
+        n) WORKERS="$OPTARG";;
         g) GUEST="$OPTARG"
             [[ ! $GUEST =~ ^(rhel|centosstream|ubuntu)$ ]] && {
                echo "Incorrect guest name $GUEST provided, must be rhel, centosstream or ubuntu."
@@ -47,15 +51,20 @@ process_args() {
     fi
     SUFFIX=${HOST}-${GUEST}-${USER}-${REPORT_FILE_DATE}
 
+    # The tests are dispatched by xdist_group (see pytest.ini), by default a
+    # group is a module so the module scoped VM factory is still shared by
+    # its tests. The number of "auto" workers is set in conftest.py
+    PARALLEL_OPTS="-n ${WORKERS}"
+
 }
 
 run_suite() {
 
     HTML_REPORT=${TEST_OUTPUT}/${SUITE}-${SUFFIX}.html
     if [  $KEEP_ISSUE_VM == true ]; then
-        PYTEST_PREFIX="python3 -m pytest --html=${HTML_REPORT} --self-contained-html --keep-vm --guest=$GUEST"
+        PYTEST_PREFIX="python3 -m pytest --html=${HTML_REPORT} --self-contained-html --keep-vm --guest=$GUEST ${PARALLEL_OPTS}"
     else
-        PYTEST_PREFIX="python3 -m pytest --html=${HTML_REPORT} --self-contained-html --guest=$GUEST"
+        PYTEST_PREFIX="python3 -m pytest --html=${HTML_REPORT} --self-contained-html --guest=$GUEST ${PARALLEL_OPTS}"
     fi
 
     PYTEST_CMD="${PYTEST_PREFIX} ${TEST_ROOT}"
@@ -67,15 +76,16 @@ run_suite() {
     echo "================================="
 
     eval "$PYTEST_CMD"
+    run_exclusive "${TEST_ROOT}"
 }
 
 run_cases() {
 
     HTML_REPORT=${TEST_OUTPUT}/${SUITE}-${SUFFIX}.html
     if [  $KEEP_ISSUE_VM == true ]; then
-        PYTEST_PREFIX="python3 -m pytest --html=${HTML_REPORT} --self-contained-html --keep-vm --guest=$GUEST"
+        PYTEST_PREFIX="python3 -m pytest --html=${HTML_REPORT} --self-contained-html --keep-vm --guest=$GUEST ${PARALLEL_OPTS}"
     else
-        PYTEST_PREFIX="python3 -m pytest --html=${HTML_REPORT} --self-contained-html --guest=$GUEST"
+        PYTEST_PREFIX="python3 -m pytest --html=${HTML_REPORT} --self-contained-html --guest=$GUEST ${PARALLEL_OPTS}"
     fi
     PYTEST_CMD="${PYTEST_PREFIX} $(printf " %s" "${CASES[@]}")"
 
@@ -84,6 +94,28 @@ run_cases() {
     echo "Keep Issue VM    : $KEEP_ISSUE_VM"
     echo "================================="
 
+    eval "$PYTEST_CMD"
+    run_exclusive "$(printf " %s" "${CASES[@]}")"
+}
+
+run_exclusive() {
+
+    # The tests marked "host_exclusive" are skipped by the parallel workers,
+    # run them serially once the other tests are done
+    [[ $WORKERS == "0" ]] && return
+
+    HTML_REPORT=${TEST_OUTPUT}/${SUITE}-exclusive-${SUFFIX}.html
+    if [  $KEEP_ISSUE_VM == true ]; then
+        PYTEST_PREFIX="python3 -m pytest --html=${HTML_REPORT} --self-contained-html --keep-vm --guest=$GUEST -n 0 -m host_exclusive"
+    else
+        PYTEST_PREFIX="python3 -m pytest --html=${HTML_REPORT} --self-contained-html --guest=$GUEST -n 0 -m host_exclusive"
+    fi
+    PYTEST_CMD="${PYTEST_PREFIX} $1"
+
+    echo "================================="
+    echo "CMD        : $PYTEST_CMD"
+    echo "================================="
+
     eval "$PYTEST_CMD"
 }
 
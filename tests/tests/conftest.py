@@ -1,19 +1,67 @@
 """
 Session and test running activities will invoke all hooks defined in conftest.py
+
+The tests can run in parallel with pytest-xdist, for example
+"pytest -n 4 --dist=loadgroup". The tests of a module are in one xdist group
+unless marked otherwise, so the module scoped fixtures below are only built
+once per module.
 """
 import os
+import hashlib
 import logging
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 # pylint: disable=no-name-in-module,import-error
 import pytest
-from pycloudstack import virtxml, artifacts
-from pycloudstack.vmguest import VMGuestFactory
+from filelock import FileLock
+from pycloudstack import virtxml, artifacts, vmm
+from pycloudstack.dut import DUT
+from pycloudstack.vmguest import VMGuestFactory, VMGuestPool
+from pycloudstack.vmparam import VM_TYPE_TD
 
 LOG = logging.getLogger(__name__)
 
+TESTS_DIR = os.path.dirname(__file__)
+OUTPUT_DIR = os.path.join(TESTS_DIR, "output")
+SSH_KEY = os.path.join(TESTS_DIR, "vm_ssh_test_key")
+SSH_PUBKEY = SSH_KEY + ".pub"
+ARTIFACT_MANIFEST = os.path.join(TESTS_DIR, "../", "artifacts.yaml")
+
+# Benchmark scripts copied into the workload TD guest
+WORKLOAD_SCRIPTS = ("nginx-bench.sh", "redis-bench.sh")
+# Guest setup of the workload TD guest done at boot, so it overlaps with the
+# wait for SSH
+WORKLOAD_SETUP = (
+    "systemctl enable docker",
+    "echo 'net.ipv6.conf.all.disable_ipv6 = 1' > /etc/sysctl.d/90-disable-ipv6.conf",
+)
+
+# Cache key of the node IDs passed in previous runs, see --use-cache-pass
+PASSED_NODES_KEY = "cc-cloud-automation/passed_nodes"
+
+_PASSED_NODES = set()
+_FAILED_NODES = set()
+
 # Disable redefined-outer-name since it is false positive for pytest's fixture
 # pylint: disable=redefined-outer-name
 
 
+def _base_nodeid(nodeid):
+    """
+    The node ID without the "@group" suffix the xdist worker appends with
+    "--dist=loadgroup", so parallel and serial runs record the same IDs.
+    """
+    return nodeid.split("@", 1)[0]
+
+
+def _worker_id():
+    """
+    The xdist worker name, each worker keeps its own copy of the images and
+    kernels while the downloads directory is shared.
+    """
+    return os.environ.get("PYTEST_XDIST_WORKER", "gw0")
+
+
 @pytest.fixture(scope="module")
 def vm_name(request):
     """
@@ -23,63 +71,173 @@ def vm_name(request):
     return name_marker.args[0] if name_marker else request.node.name
 
 
+@pytest.fixture(scope="session")
+def resolved_artifacts():
+    """
+    The artifact paths resolved in the session keyed by marker name. Getting
+    an artifact hashes the cached file and may fetch the remote sha256sum, so
+    it is done once per name instead of once per module.
+    """
+    return {}
+
+
+def _get_artifact(config, artifact_factory, name, dest_dir):
+    """
+    Get the artifact of given name for the guest OS into dest_dir
+    """
+    cache_dir = config.cache.makedir('downloads')
+    dest_dir = config.cache.makedir(dest_dir + '-' + _worker_id())
+
+    guest = config.getoption("--guest")
+    name = name + '-' + guest
+    # pylint: disable=unsubscriptable-object
+    artobj = artifact_factory[name]
+    assert artobj is not None, f"Fail to find the {name} in artifacts.yaml"
+    # Only one xdist worker fetches the artifact, others wait and reuse it
+    with FileLock(str(cache_dir) + ".lock"):
+        return artobj.get(dest_dir, cache_dir)
+
+
+def _get_vm_image(config, artifact_factory, name, vm_ssh_pubkey):
+    """
+    Get the VM image, the test SSH key is injected into the image once so the
+    VMs cloned from it are ready for SSH.
+    """
+    image_path = _get_artifact(config, artifact_factory, name, 'vm-images')
+    image_dir = str(config.cache.makedir('vm-images-' + _worker_id()))
+    if os.path.dirname(os.path.realpath(image_path)) != os.path.realpath(image_dir):
+        # A local artifact is the user's own image, inject the key into a
+        # copy of it instead
+        image_copy = os.path.join(image_dir, os.path.basename(image_path))
+        if not os.path.exists(image_copy) or \
+                os.path.getmtime(image_copy) < os.path.getmtime(image_path):
+            LOG.info("copying file: %s -> %s", image_path, image_copy)
+            shutil.copyfile(image_path, image_copy)
+        image_path = image_copy
+    with FileLock(image_path + ".lock"):
+        VMGuestFactory.prepare_base_image(image_path, vm_ssh_pubkey)
+    return image_path
+
+
+def _resolve_once(resolved, getter, config, artifact_factory, name, *args):
+    """
+    Get the artifact of given name with getter, the path is kept in resolved
+    so later calls in the session return it directly.
+    """
+    key = (getter.__name__, name)
+    if key not in resolved:
+        resolved[key] = getter(config, artifact_factory, name, *args)
+    return resolved[key]
+
+
 @pytest.fixture(scope="module")
-def vm_image(request, artifact_factory):
+def vm_image(request, artifact_factory, vm_ssh_pubkey, resolved_artifacts):
     """
     Customized VM image in module scope
     """
-    cache_dir = request.config.cache.makedir('downloads')
-    dest_dir = request.config.cache.makedir('vm-images')
-
     image_marker = request.node.get_closest_marker("vm_image")
     if not image_marker:
         raise ValueError("Missing vm_image marker")
-
-    guest = request.config.getoption("--guest")
-    image = image_marker.args[0] + '-' + guest
-    if not image:
+    if not image_marker.args[0]:
         raise ValueError("Invalid VM OS Image")
-    # pylint: disable=unsubscriptable-object
-    artobj = artifact_factory[image]
-    assert artobj is not None, f"Fail to find the {image} in artifacts.yaml"
-    return artobj.get(dest_dir, cache_dir)
+    return _resolve_once(resolved_artifacts, _get_vm_image, request.config,
+                         artifact_factory, image_marker.args[0], vm_ssh_pubkey)
 
 
 @pytest.fixture(scope="module")
-def vm_kernel(request, artifact_factory):
+def vm_kernel(request, artifact_factory, resolved_artifacts):
     """
     Customized VM kernel in module scope
     """
-    cache_dir = request.config.cache.makedir('downloads')
-    dest_dir = request.config.cache.makedir('vm-kernels')
-
-    image_marker = request.node.get_closest_marker("vm_kernel")
-    if not image_marker:
+    kernel_marker = request.node.get_closest_marker("vm_kernel")
+    if not kernel_marker:
         raise ValueError("Missing vm_kernel marker")
-
-    guest = request.config.getoption("--guest")
-    kernel = image_marker.args[0] + '-' + guest
-    if not kernel:
+    if not kernel_marker.args[0]:
         raise ValueError("Invalid VM kernel")
-    # pylint: disable=unsubscriptable-object
-    artobj = artifact_factory[kernel]
-    assert artobj is not None, f"Fail to find the {kernel} in artifacts.yaml"
-    return artobj.get(dest_dir, cache_dir)
+    return _resolve_once(resolved_artifacts, _get_artifact, request.config,
+                         artifact_factory, kernel_marker.args[0], 'vm-kernels')
 
 
-# pylint: disable=redefined-outer-name
+@pytest.fixture(scope="session")
+def vm_factories(request):
+    """
+    The VM factories of the session keyed by (image, kernel), so the modules
+    using the same artifacts share one factory.
+    """
+    factories = {}
+    yield factories
+    LOG.info("Delete factory instances for cleanup")
+    keep_issue_vm = request.config.getoption("--keep-vm")
+    for factoryobj in factories.values():
+        factoryobj.set_keep_issue_vm(keep_issue_vm)
+        factoryobj.removeall()
+    factories.clear()
+
+
+@pytest.fixture(scope="session")
+def libvirt_conn():
+    """
+    Hold the shared libvirt connection for the whole session, so it is not
+    closed and opened again whenever all VMs of a module are destroyed.
+    Each xdist worker has its own connection.
+    """
+    conn = vmm.acquire_connection()
+    yield conn
+    vmm.release_connection()
+
+
+# pylint: disable=redefined-outer-name,unused-argument
 @pytest.fixture(scope="module")
-def vm_factory(request, vm_image, vm_kernel):
+def vm_factory(request, libvirt_conn, vm_factories, vm_image, vm_kernel):
     """
     New mark for the vm factory to create different VM.
+
+    The factory is kept for the whole session, only the VMs created by the
+    module are removed when the module finishes.
     """
-    factoryobj = VMGuestFactory(vm_image, vm_kernel)
+    key = (vm_image, vm_kernel)
+    factoryobj = vm_factories.get(key)
+    if factoryobj is None:
+        factoryobj = VMGuestFactory(vm_image, vm_kernel)
+        vm_factories[key] = factoryobj
     yield factoryobj
-    LOG.info("Delete factory instance for cleanup")
+    LOG.info("Delete VMs of module for cleanup")
     keep_issue_vm = request.config.getoption("--keep-vm")
     factoryobj.set_keep_issue_vm(keep_issue_vm)
     factoryobj.removeall()
-    del factoryobj
+
+
+@pytest.fixture(scope="session")
+def vm_pools(request):
+    """
+    The VM pools of the session keyed by (image, kernel). Each pool has its
+    own factory, so its VMs are not removed when a module finishes.
+    """
+    pools = {}
+    yield pools
+    LOG.info("Delete pooled VMs for cleanup")
+    keep_issue_vm = request.config.getoption("--keep-vm")
+    for poolobj in pools.values():
+        poolobj.factory.set_keep_issue_vm(keep_issue_vm)
+        poolobj.removeall()
+    pools.clear()
+
+
+@pytest.fixture(scope="module")
+def vm_pool(request, libvirt_conn, vm_pools, vm_image, vm_kernel):
+    """
+    The VM pool for the image and kernel of the module. A test gets a started
+    VM with "with vm_pool.guest(vm_type) as inst", so the tests that only boot
+    and stop a guest reuse the defined domains.
+    """
+    key = (vm_image, vm_kernel)
+    poolobj = vm_pools.get(key)
+    if poolobj is None:
+        poolobj = VMGuestPool(VMGuestFactory(vm_image, vm_kernel))
+        # The VMs of failed tests are removed as soon as they are released
+        poolobj.factory.set_keep_issue_vm(request.config.getoption("--keep-vm"))
+        vm_pools[key] = poolobj
+    return poolobj
 
 
 @pytest.fixture(autouse=True, scope="session")
@@ -87,10 +245,9 @@ def output():
     """
     Get output path
     """
-    outdir = os.path.join(os.path.dirname(__file__), "output")
-    os.makedirs(outdir, exist_ok=True)
-    virtxml.VirtXml.set_output_dir(outdir)
-    return outdir
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    virtxml.VirtXml.set_output_dir(OUTPUT_DIR)
+    return OUTPUT_DIR
 
 
 @pytest.fixture(autouse=True, scope="session")
@@ -98,7 +255,7 @@ def vm_ssh_key():
     """
     SSH key for remote running command to guest VM
     """
-    return os.path.join(os.path.dirname(__file__), "vm_ssh_test_key")
+    return SSH_KEY
 
 
 @pytest.fixture(autouse=True, scope="session")
@@ -106,18 +263,100 @@ def vm_ssh_pubkey():
     """
     SSH key for remote running command to guest VM
     """
-    return os.path.join(os.path.dirname(__file__), "vm_ssh_test_key.pub")
+    return SSH_PUBKEY
+
+
+@pytest.fixture(scope="session")
+def td_workload_vm(request, libvirt_conn, artifact_factory, vm_ssh_pubkey,
+                   resolved_artifacts):
+    """
+    A booted TD guest shared by the workload tests of the session, all the
+    benchmark scripts are copied into its image and docker is enabled with
+    one virt-customize before boot, so the tests just run them over SSH.
+
+    It has its own factory since the module scoped vm_factory removes its
+    VMs when a module finishes.
+    """
+    image = _resolve_once(resolved_artifacts, _get_vm_image, request.config,
+                          artifact_factory, "latest-guest-image", vm_ssh_pubkey)
+    kernel = _resolve_once(resolved_artifacts, _get_artifact, request.config,
+                           artifact_factory, "latest-guest-kernel", 'vm-kernels')
+    factoryobj = VMGuestFactory(image, kernel)
+
+    LOG.info("Create TD guest for workload tests")
+    # The domain is defined while virt-customize prepares the image
+    inst = factoryobj.new_vm(VM_TYPE_TD, prepare_async=True)
+    inst.image.customize(
+        commands=WORKLOAD_SETUP,
+        copy_in=[os.path.join(TESTS_DIR, script) for script in WORKLOAD_SCRIPTS])
+    inst.create()
+    inst.start()
+    assert inst.wait_for_ssh_ready(strategy="expo"), "Boot timeout"
+
+    yield inst
+
+    factoryobj.set_keep_issue_vm(request.config.getoption("--keep-vm"))
+    factoryobj.removeall()
+
+
+@pytest.fixture(scope="session")
+def boot_pool():
+    """
+    Thread pool to boot VMs in background, it is large enough for the
+    max number of TDs booted together by test_multiple_tdvms
+    """
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        yield executor
+
+
+@pytest.fixture
+def async_boot(boot_pool):
+    """
+    Function to create and start a VM in background. It returns a future
+    whose result is the return of wait_for_ssh_ready(), so the boot of
+    several VMs can overlap.
+    """
+    def _boot(inst):
+        inst.create()
+        inst.start()
+        return inst.wait_for_ssh_ready(strategy="expo")
+
+    return lambda inst: boot_pool.submit(_boot, inst)
 
 
 @pytest.fixture(scope="session")
-def artifact_factory():
+def artifact_factory(request):
     """
     The artifact factory from artifacts.yaml
+
+    The parsed manifest is kept in pytest cache keyed by the hash of
+    artifacts.yaml, so xdist workers and later runs skip the YAML parsing.
+    """
+    with open(ARTIFACT_MANIFEST, "rb") as fobj:
+        digest = hashlib.sha256(fobj.read()).hexdigest()
+    cache_key = "artifact_manifest/" + digest
+    manifest = request.config.cache.get(cache_key, None)
+    if manifest is None:
+        manifest = artifacts.ArtifactManifest(ARTIFACT_MANIFEST).load()
+        assert manifest is not None
+        request.config.cache.set(cache_key, manifest)
+    return artifacts.ArtifactFactory(manifest)
+
+
+def pytest_sessionstart(session):  # pylint: disable=unused-argument
+    """
+    Start the libvirt event loop before any connection is opened, the state
+    waits of VMs then return on the lifecycle events instead of polling.
+    """
+    vmm.start_event_loop()
+
+
+def pytest_xdist_auto_num_workers(config):  # pylint: disable=unused-argument
+    """
+    The number of workers of "-n auto", one per CPU except two which are
+    left for libvirtd and QEMU.
     """
-    manifest_file = os.path.join(os.path.dirname(__file__), "../", "artifacts.yaml")
-    fobj = artifacts.ArtifactManifest(manifest_file)
-    assert fobj.load() is not None
-    return artifacts.ArtifactFactory(fobj)
+    return max(len(os.sched_getaffinity(0)) - 2, 1)
 
 
 def pytest_addoption(parser):
@@ -128,3 +367,73 @@ def pytest_addoption(parser):
         "--keep-vm", action="store_true", default=False, help="NOT destroy unhealty VMs"
     )
     parser.addoption("--guest", action="store", default="centosstream")
+    parser.addoption(
+        "--use-cache-pass", action="store_true", default=False,
+        help="skip tests passed in previous runs, to iterate on the failed ones"
+    )
+
+
+# Run before the hook of the xdist worker, which turns the xdist_group marks
+# into "@group" suffixes of the node IDs
+@pytest.hookimpl(tryfirst=True)
+def pytest_collection_modifyitems(config, items):
+    """
+    Put each test without xdist_group mark into the group of its module, so
+    "--dist=loadgroup" keeps a module on one worker like "--dist=loadscope"
+    while a module can still split its tests into several groups.
+
+    Skip the TD tests at collection time if TDX is not enabled in KVM, they
+    are the tests marked with "tdx" or parametrized with the TD VM type.
+
+    Skip the tests marked with "host_exclusive" in xdist workers, they take
+    most of the host and only run serially ("-n 0"), run.sh runs them in a
+    second pass.
+
+    Skip the tests passed in previous runs if --use-cache-pass is given
+    """
+    tdx_ready = DUT.kvm_support_tdx()
+    skip_tdx = pytest.mark.skip(reason="TDX is not enabled in KVM")
+    in_worker = hasattr(config, "workerinput")
+    skip_exclusive = pytest.mark.skip(reason="Needs the whole host, run with -n 0")
+    for item in items:
+        if item.get_closest_marker("xdist_group") is None:
+            item.add_marker(pytest.mark.xdist_group(item.module.__name__))
+        if in_worker and item.get_closest_marker("host_exclusive") is not None:
+            item.add_marker(skip_exclusive)
+        if tdx_ready:
+            continue
+        callspec = getattr(item, "callspec", None)
+        if item.get_closest_marker("tdx") is not None or \
+                (callspec is not None and callspec.params.get("vm_type") == VM_TYPE_TD):
+            item.add_marker(skip_tdx)
+
+    if not config.getoption("--use-cache-pass"):
+        return
+    passed = set(config.cache.get(PASSED_NODES_KEY, []))
+    skip_passed = pytest.mark.skip(reason="cached pass")
+    for item in items:
+        if _base_nodeid(item.nodeid) in passed:
+            item.add_marker(skip_passed)
+
+
+def pytest_runtest_logreport(report):
+    """
+    Track the result of each test, with xdist the reports of the workers are
+    also received by the controller.
+    """
+    if report.passed and report.when == "call":
+        _PASSED_NODES.add(_base_nodeid(report.nodeid))
+    elif report.failed:
+        _FAILED_NODES.add(_base_nodeid(report.nodeid))
+
+
+def pytest_sessionfinish(session):
+    """
+    Save the passed tests into the cache, only done by the xdist controller
+    or by pytest itself when xdist is not used.
+    """
+    if hasattr(session.config, "workerinput"):
+        return
+    passed = set(session.config.cache.get(PASSED_NODES_KEY, []))
+    passed = (passed | _PASSED_NODES) - _FAILED_NODES
+    session.config.cache.set(PASSED_NODES_KEY, sorted(passed))
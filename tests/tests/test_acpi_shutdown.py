@@ -3,7 +3,6 @@ Call "poweroff" command within VM
 """
 
 import logging
-import time
 import pytest
 from pycloudstack.vmparam import VM_TYPE_LEGACY, VM_STATE_SHUTDOWN, VM_TYPE_EFI, VM_TYPE_TD
 
@@ -16,16 +15,17 @@ LOG = logging.getLogger(__name__)
 pytestmark = [
     pytest.mark.vm_image("latest-guest-image"),
     pytest.mark.vm_kernel("latest-guest-kernel"),
+    pytest.mark.timeout(300),
 ]
 
 
-def test_tdvm_acpi_shutdown(vm_factory, vm_ssh_pubkey, vm_ssh_key):
+@pytest.mark.parametrize("vm_type", [VM_TYPE_TD, VM_TYPE_EFI, VM_TYPE_LEGACY])
+def test_acpi_shutdown(vm_factory, vm_type, vm_ssh_key):
     """
-    Test ACPI shutdown for TD guest
+    Test ACPI shutdown for TD, EFI and legacy guest
     """
-    LOG.info("Create TD guest")
-    inst = vm_factory.new_vm(VM_TYPE_TD)
-    inst.image.inject_root_ssh_key(vm_ssh_pubkey)
+    LOG.info("Create %s guest", vm_type)
+    inst = vm_factory.new_vm(vm_type)
 
     # create and start VM instance
     inst.create()
@@ -34,44 +34,4 @@ def test_tdvm_acpi_shutdown(vm_factory, vm_ssh_pubkey, vm_ssh_key):
 
     inst.ssh_run(["poweroff"], vm_ssh_key)
 
-    # Sleep for a while for shutdown first
-    time.sleep(5)
-    assert inst.wait_for_state(VM_STATE_SHUTDOWN), "shutdown fail"
-
-def test_efi_acpi_shutdown(vm_factory, vm_ssh_pubkey, vm_ssh_key):
-    """
-    Test ACPI shutdown for EFI guest
-    """
-    LOG.info("Create EFI guest")
-    inst = vm_factory.new_vm(VM_TYPE_EFI)
-    inst.image.inject_root_ssh_key(vm_ssh_pubkey)
-
-    # create and start VM instance
-    inst.create()
-    inst.start()
-    assert inst.wait_for_ssh_ready()
-
-    inst.ssh_run(["poweroff"], vm_ssh_key)
-
-    # Sleep for a while for shutdown first
-    time.sleep(5)
-    assert inst.wait_for_state(VM_STATE_SHUTDOWN), "shutdown fail"
-
-def test_legacy_acpi_shutdown(vm_factory, vm_ssh_pubkey, vm_ssh_key):
-    """
-    Test ACPI shutdown for legacy VM
-    """
-    LOG.info("Create legacy guest")
-    inst = vm_factory.new_vm(VM_TYPE_LEGACY)
-    inst.image.inject_root_ssh_key(vm_ssh_pubkey)
-
-    # create and start VM instance
-    inst.create()
-    inst.start()
-    assert inst.wait_for_ssh_ready()
-
-    inst.ssh_run(["poweroff"], vm_ssh_key)
-
-    # Sleep for a while for shutdown first
-    time.sleep(5)
-    assert inst.wait_for_state(VM_STATE_SHUTDOWN), "shutdown fail"
+    assert inst.wait_for_state(VM_STATE_SHUTDOWN, timeout=60), "shutdown fail"
@@ -6,23 +6,49 @@ This test case is designed reference to :
     optimization-for-tensorflow-installation-guide.html
 """
 import re
+import shlex
 import logging
 import pytest
+from pycloudstack.dut import DUT
 from pycloudstack.vmparam import VM_TYPE_TD, VM_TYPE_EFI, VM_TYPE_LEGACY, VMSpec
+from .utils import first_match
 
 __author__ = 'cpio'
 
 LOG = logging.getLogger(__name__)
 
+# The benchmark still passes on hosts without AMX through the slow fallback
+# path, skip it to not waste up to 30 minutes per VM type
+if not DUT.support_amx():
+    pytest.skip("AMX not available on host", allow_module_level=True)
+
+# Throughput line of the benchmark output, searched line by line
+_PATT_OK = re.compile(r'Approximate accelerator performance in recommendations/second is (\d*\.\d*)')
+
+# DIEN benchmark command, it needs a shell for the "cd" and the environment
+# prefix. The script is quoted since ssh joins the argv into one command line.
+_DIEN_CMD = ["sh", "-c", shlex.quote(
+    "cd /root/models && DNNL_MAX_CPU_ISA=AVX512_CORE_AMX OMP_NUM_THREADS=16 "
+    "KMP_AFFINITY=granularity=fine,verbose,compact python3 ./benchmarks/launch_benchmark.py "
+    "--model-name dien --mode inference --precision bfloat16 "
+    "--framework tensorflow --data-location /root/dien "
+    "--exact-max-length=100 --num-inter-threads 1 --num-intra-threads 16 "
+    "--batch-size 8 --graph-type=static "
+    "--in-graph /root/dien_fp32_static_rnn_graph.pb "
+    "--benchmark-only --verbose --"
+)]
+
 # pylint: disable=invalid-name
 pytestmark = [
     pytest.mark.vm_kernel("latest-guest-kernel"),
     pytest.mark.vm_image("latest-ai-image"),
+    # The benchmark alone may take up to 30 minutes, leave room for the boot
+    pytest.mark.timeout(2400),
 ]
 
 
 @pytest.mark.parametrize("vm_type", [VM_TYPE_TD, VM_TYPE_EFI, VM_TYPE_LEGACY])
-def test_vm_tf_infer_dien_bf16(vm_factory, vm_type, vm_ssh_pubkey, vm_ssh_key):
+def test_vm_tf_infer_dien_bf16(vm_factory, vm_type, vm_ssh_key):
     """
     Test DIEN inference with BF18:
     Ref: https://github.com/IntelAI/models/tree/master/benchmarks/ \
@@ -31,9 +57,6 @@ def test_vm_tf_infer_dien_bf16(vm_factory, vm_type, vm_ssh_pubkey, vm_ssh_key):
     LOG.info("Create TD guest to test tensorflow")
     td_inst = vm_factory.new_vm(vm_type, vmspec=VMSpec.model_large())
 
-    # customize the VM image
-    td_inst.image.inject_root_ssh_key(vm_ssh_pubkey)
-
     # create and start VM instance
     td_inst.create()
     td_inst.start()
@@ -42,21 +65,11 @@ def test_vm_tf_infer_dien_bf16(vm_factory, vm_type, vm_ssh_pubkey, vm_ssh_key):
     # It may take up to 30 minutes to complete the test
     LOG.info("====== The test running may take up to 30 minutes! ======")
 
-    command = '''
-    cd /root/models && DNNL_MAX_CPU_ISA=AVX512_CORE_AMX OMP_NUM_THREADS=16 KMP_AFFINITY=granularity=fine,verbose,compact python3 ./benchmarks/launch_benchmark.py
-    --model-name dien  --mode inference  --precision bfloat16
-    --framework tensorflow --data-location /root/dien
-    --exact-max-length=100 --num-inter-threads 1  --num-intra-threads 16
-    --batch-size 8 --graph-type=static
-    --in-graph /root/dien_fp32_static_rnn_graph.pb
-    --benchmark-only --verbose --
-     '''
-    runner = td_inst.ssh_run(command.split(), vm_ssh_key)
+    runner = td_inst.ssh_run(_DIEN_CMD, vm_ssh_key)
     assert runner.retcode == 0, "Failed to execute remote command"
 
     # throughput should not be 0
-    patt_ok = r'Approximate accelerator performance in recommendations/second is (\d*.\d*)'
-    match = re.search(patt_ok, '\n'.join(runner.stdout))
+    match = first_match(runner.stdout, _PATT_OK)
     assert match is not None
     images_per_s = match.group(1)
     LOG.info('Throughput: %s recommendations/s', images_per_s)
@@ -3,6 +3,7 @@ This module provide the case to test VM boot with max vCPU
 
 """
 
+import functools
 import logging
 import psutil
 import pytest
@@ -17,21 +18,31 @@ LOG = logging.getLogger(__name__)
 pytestmark = [
     pytest.mark.vm_image("latest-guest-image"),
     pytest.mark.vm_kernel("latest-guest-kernel"),
+    # The max vCPU VMs take most of the host, no other VM may run at the
+    # same time
+    pytest.mark.host_exclusive,
 ]
 
-# Get host total cores and sockets, assign 80% vcpu and 80% memory to vm
-total_core = psutil.cpu_count()
-cores = int(total_core * 0.4)
-memsize = int(psutil.virtual_memory().available / 1000 * 0.8)
-vmspec = VMSpec(sockets=2, cores=cores, memsize=memsize)
 
+@functools.lru_cache(maxsize=1)
+def _host_vmspec():
+    """
+    Get host total cores and sockets, assign 80% vcpu and 80% memory to vm.
+    The host is sampled once so all tests use the same VM spec.
+    """
+    total_core = psutil.cpu_count()
+    cores = int(total_core * 0.4)
+    memsize = int(psutil.virtual_memory().available / 1000 * 0.8)
+    return VMSpec(sockets=2, cores=cores, memsize=memsize)
+
+@pytest.mark.tdx
 def test_td_max_vcpu(vm_factory):
     """
     Test boot TD guest with max vcpu KVM supports
     """
 
     LOG.info("Create guest")
-    inst = vm_factory.new_vm(VM_TYPE_TD, vmspec=vmspec, auto_start=True)
+    inst = vm_factory.new_vm(VM_TYPE_TD, vmspec=_host_vmspec(), auto_start=True)
 
     assert inst.wait_for_state(VM_STATE_RUNNING), "Boot fail"
     assert inst.wait_for_ssh_ready(), "Boot timeout"
@@ -45,7 +56,7 @@ def test_efi_max_vcpu(vm_factory):
     """
 
     LOG.info("Create guest")
-    inst = vm_factory.new_vm(VM_TYPE_EFI, vmspec=vmspec, auto_start=True)
+    inst = vm_factory.new_vm(VM_TYPE_EFI, vmspec=_host_vmspec(), auto_start=True)
 
     assert inst.wait_for_state(VM_STATE_RUNNING), "Boot fail"
     assert inst.wait_for_ssh_ready(), "Boot timeout"
@@ -59,7 +70,7 @@ def test_legacy_max_vcpu(vm_factory):
     """
 
     LOG.info("Create guest")
-    inst = vm_factory.new_vm(VM_TYPE_LEGACY, vmspec=vmspec, auto_start=True)
+    inst = vm_factory.new_vm(VM_TYPE_LEGACY, vmspec=_host_vmspec(), auto_start=True)
 
     assert inst.wait_for_state(VM_STATE_RUNNING), "Boot fail"
     assert inst.wait_for_ssh_ready(), "Boot timeout"
@@ -17,22 +17,22 @@ MAX_TD_GUEST = 11  # 11 could fit most of RAM/CPU cases
 pytestmark = [
     pytest.mark.vm_image("latest-guest-image"),
     pytest.mark.vm_kernel("latest-guest-kernel"),
+    pytest.mark.tdx,
+    # The TDs take most of the host, no other VM may run at the same time
+    pytest.mark.host_exclusive,
 ]
 
 
-def test_tdvms_coexist_create_destroy(vm_factory):
+def test_tdvms_coexist_create_destroy(vm_factory, async_boot):
     """
     Test multiple TDVMs create/destory.
 
-    Step 1. Create max number of TDVMs one by one
+    Step 1. Create max number of TDVMs in parallel
     Step 2. Destroy each TDVM one by one
 
     NOTE: vm_factory will cleanup all created VM instance in its __del__ later,
           so do not clean them explicity.
     """
-    for index in range(MAX_TD_GUEST):
-        LOG.info("Create %d TD", index)
-        vm_factory.new_vm(VM_TYPE_TD, auto_start=True)
-
-    for item in vm_factory.vms.values():
-        item.wait_for_ssh_ready()
+    LOG.info("Create %d TDs", MAX_TD_GUEST)
+    futures = [async_boot(vm_factory.new_vm(VM_TYPE_TD)) for _ in range(MAX_TD_GUEST)]
+    assert all(future.result() for future in futures), "Boot timeout"
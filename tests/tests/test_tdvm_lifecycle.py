@@ -20,6 +20,8 @@ LOG = logging.getLogger(__name__)
 pytestmark = [
     pytest.mark.vm_image("latest-guest-image"),
     pytest.mark.vm_kernel("latest-guest-kernel"),
+    pytest.mark.timeout(300),
+    pytest.mark.tdx,
 ]
 
 
@@ -11,65 +11,63 @@ __author__ = 'cpio'
 
 LOG = logging.getLogger(__name__)
 
+# Fetched by the guest through the NAT or bridge network of the host
+WGET_URL = "https://www.baidu.com/"
+
+# Disable redefined-outer-name since it is false positive for pytest's fixture
+# pylint: disable=redefined-outer-name
+
 
 # pylint: disable=invalid-name
 pytestmark = [
     pytest.mark.vm_image("latest-guest-image"),
     pytest.mark.vm_kernel("latest-guest-kernel"),
+    pytest.mark.timeout(300),
+    pytest.mark.tdx,
 ]
 
 
-def test_tdvm_wget(vm_factory, vm_ssh_pubkey, vm_ssh_key):
+@pytest.fixture(scope="module")
+def network_td(vm_factory):
     """
-    Test wget functionality within TD guest, the network could be NAT, bridget.
+    Create and start a TD guest shared by the network tests. The tests only
+    probe the network and do not change the guest, so one boot is enough.
     """
-
     LOG.info("Create TD guest")
-    vm_inst = vm_factory.new_vm(VM_TYPE_TD)
-
-    # customize the VM image
-    vm_inst.image.inject_root_ssh_key(vm_ssh_pubkey)
+    inst = vm_factory.new_vm(VM_TYPE_TD)
 
     # create and start VM instance
-    vm_inst.create()
-    vm_inst.start()
-    assert vm_inst.wait_for_ssh_ready(), "Boot timeout"
+    inst.create()
+    inst.start()
+    assert inst.wait_for_ssh_ready(), "Boot timeout"
 
-    runner = vm_inst.ssh_run(["wget", "https://www.baidu.com/"], vm_ssh_key)
-    assert runner.retcode == 0, "Failed to execute remote command"
+    yield inst
+
+    inst.destroy()
 
 
-def test_tdvm_ssh_forward(vm_factory, vm_ssh_pubkey, vm_ssh_key):
+def test_tdvm_wget(network_td, vm_ssh_key):
     """
-    Test SSH forward functionality within TD guest
+    Test wget functionality within TD guest, the network could be NAT, bridget.
     """
-    LOG.info("Create TD guest")
-    inst = vm_factory.new_vm(VM_TYPE_TD)
-    inst.image.inject_root_ssh_key(vm_ssh_pubkey)
+    assert network_td.get_ip() is not None, "No IP address for the guest"
+    runner = network_td.ssh_run(["wget", "-q", "-O", "/dev/null", WGET_URL], vm_ssh_key)
+    assert runner.retcode == 0, "Failed to execute remote command"
 
-    # create and start VM instance
-    inst.create()
-    inst.start()
-    assert inst.wait_for_ssh_ready()
 
-    runner = inst.ssh_run(["ls", "/"], vm_ssh_key)
+def test_tdvm_ssh_forward(network_td, vm_ssh_key):
+    """
+    Test SSH forward functionality within TD guest
+    """
+    runner = network_td.ssh_run(["ls", "/"], vm_ssh_key)
     assert runner.retcode == 0, "Failed to execute remote command"
 
 
-def test_tdvm_bridge_network_ip(vm_factory):
+def test_tdvm_bridge_network_ip(network_td):
     """
     Test wget functionality within TD guest, the network could be NAT, bridget.
     """
-
-    LOG.info("Create TD guest")
-    vm_inst = vm_factory.new_vm(VM_TYPE_TD)
-
-    # create and start VM instance
-    vm_inst.create()
-    vm_inst.start()
-    assert vm_inst.wait_for_ssh_ready(), "Boot timeout"
-
-    vm_bridge_ip = vm_inst.get_ip()
+    vm_bridge_ip = network_td.get_ip()
     assert vm_bridge_ip is not None
 
     runner = NativeCmdRunner(["ping", "-c", "3", vm_bridge_ip])
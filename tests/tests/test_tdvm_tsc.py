@@ -6,6 +6,7 @@ TDX Guest check: to verify TDX guest basic environment:
 """
 import os
 import re
+import shlex
 import datetime
 import logging
 import pytest
@@ -25,16 +26,16 @@ DATE_SUFFIX = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
 pytestmark = [
     pytest.mark.vm_kernel("latest-guest-kernel"),       # from artifacts.yaml
     pytest.mark.vm_image("latest-guest-image"),    # from artifacts.yaml
+    pytest.mark.tdx,
 ]
 
 
 @pytest.fixture(scope="module")
-def base_td_guest_inst(vm_factory, vm_ssh_pubkey):
+def base_td_guest_inst(vm_factory):
     """
     Create and start a td guest instance
     """
     td_inst = vm_factory.new_vm(VM_TYPE_TD)
-    td_inst.image.inject_root_ssh_key(vm_ssh_pubkey)
     td_inst.create()
     td_inst.start()
     assert td_inst.wait_for_ssh_ready(), "Boot timeout"
@@ -44,21 +45,27 @@ def base_td_guest_inst(vm_factory, vm_ssh_pubkey):
     td_inst.destroy()
 
 
-def _remote_run_and_fetch(td_inst, vm_ssh_key, output, command, output_file):
+def _remote_run_and_fetch(td_inst, vm_ssh_key, output, cmdarr, output_file=None):
     """
-    Runs a command in TD guest and then scp_out the result
+    Runs a command in TD guest and return the lines of its stdout
 
-    The result is fetched to host and the caller will do further check
+    cmdarr is the argv list of the command, no shell is involved unless the
+    caller runs one explicitly.
+
+    The result is returned to host and the caller will do further check
     on the result, though the "further check" can also take place in guest.
-    One of the reason to fetch the result to host is to save the original output
-    and upload to log server for manual analysis in case needed.
+    If output_file is given, the original output is also saved into the output
+    dir so that it can be uploaded to log server for manual analysis in case
+    needed.
     """
-    runner = td_inst.ssh_run(command.split(), vm_ssh_key)
+    runner = td_inst.ssh_run(cmdarr, vm_ssh_key)
     assert runner.retcode == 0, "failed to execute remote command"
 
-    runner = td_inst.scp_out(
-        os.path.join('/tmp', output_file), output, vm_ssh_key)
-    assert runner.retcode == 0, "failed to copy-out result file"
+    if output_file is not None:
+        saved_file = os.path.join(output, output_file)
+        with open(saved_file, 'w', encoding="utf8") as fsaved:
+            fsaved.write("\n".join(runner.stdout))
+    return runner.stdout
 
 
 def test_tdvm_clocksource_tsc(base_td_guest_inst, vm_ssh_key, output):
@@ -66,21 +73,17 @@ def test_tdvm_clocksource_tsc(base_td_guest_inst, vm_ssh_key, output):
     check clocksource is *tsc* in TD guest.
 
     1. remotely run *cat /sys/devices/system/clocksource/clocksource0/current_clocksource*
-    2. copy result from td guest to local dir
-    3. compare the clocksource name with *tsc*
+    2. compare the clocksource name with *tsc*
     """
     LOG.info("Test if clocksource is tsc in TD guest")
 
     output_file = f"tdx_clocksource_check_{DATE_SUFFIX}.log"
-    command = f"cat /sys/devices/system/clocksource/clocksource0/current_clocksource\
-                > /tmp/{output_file}"
-
-    _remote_run_and_fetch(base_td_guest_inst, vm_ssh_key, output, command, output_file)
+    cmdarr = ["cat", "/sys/devices/system/clocksource/clocksource0/current_clocksource"]
 
-    saved_file = os.path.join(output, output_file)
-    with open(saved_file, 'r', encoding="utf8") as fsaved:
-        assert fsaved.read().strip() == "tsc"
-        LOG.info("TD guest clocksource is tsc")
+    stdout = _remote_run_and_fetch(base_td_guest_inst, vm_ssh_key, output,
+                                   cmdarr, output_file)
+    assert stdout[0].strip() == "tsc"
+    LOG.info("TD guest clocksource is tsc")
 
 
 def test_tdvm_cpuid_tscfreq(base_td_guest_inst, vm_ssh_key, output):
@@ -95,24 +98,20 @@ def test_tdvm_cpuid_tscfreq(base_td_guest_inst, vm_ssh_key, output):
            = (CPUID.15H.ECX[31:0]*CPUID.15H.EBX[31:0])÷CPUID.15H.EAX[31:0]
 
     1. remotely run *cpuid -r -l 0x15*
-    2. copy result from td guest to local dir
-    3. check eax value
+    2. check eax value
     """
     LOG.info("Check cpuid 0x15.0 TD guest, eax = 0x00000001")
     output_file = f"cpuid_0x15_check_{DATE_SUFFIX}.log"
-    command = f"cpuid -r -l 0x15 > /tmp/{output_file}"
-
-    _remote_run_and_fetch(base_td_guest_inst, vm_ssh_key, output, command, output_file)
+    cmdarr = ["cpuid", "-r", "-l", "0x15"]
 
-    saved_file = os.path.join(output, output_file)
+    stdout = _remote_run_and_fetch(base_td_guest_inst, vm_ssh_key, output,
+                                   cmdarr, output_file)
     found_exe_1 = False
-    with open(saved_file, 'r', encoding="utf8") as fsaved:
-        cpuid_strs = fsaved.readlines()
-        for line in cpuid_strs:
-            if line.find('eax=0x00000001') != -1:
-                LOG.info("EAX value of cpuid#0x15.0 is 0x00000001")
-                found_exe_1 = True
-                break
+    for line in stdout:
+        if line.find('eax=0x00000001') != -1:
+            LOG.info("EAX value of cpuid#0x15.0 is 0x00000001")
+            found_exe_1 = True
+            break
     assert found_exe_1
 
 
@@ -135,16 +134,14 @@ def test_tdvm_compare2_host_tscfreq(base_td_guest_inst, vm_ssh_key, output):
     host_freq = max(host_freq, 1000000)
 
     output_file = f"guest_tsc_freq_check_{DATE_SUFFIX}.log"
-    command = f"dmesg |grep mhz -i > /tmp/{output_file}"
-
-    _remote_run_and_fetch(base_td_guest_inst, vm_ssh_key, output, command, output_file)
-
-    saved_file = os.path.join(output, output_file)
-    guest_freq = 0
-    with open(saved_file, 'r', encoding="utf8") as fsaved:
-        lines = fsaved.readlines()
-        assert len(lines) == 1
-        str_freq = re.findall("Detected (.+?) MHz", lines[0])
-        guest_freq = int(float(str_freq[0].strip())) * 1000
-        LOG.info("TD guest tsc frequency is %d", guest_freq)
+    # The pipeline needs a shell, quote it since ssh joins the argv into
+    # one remote command line
+    cmdarr = ["sh", "-c", shlex.quote("dmesg | grep -i mhz")]
+
+    lines = _remote_run_and_fetch(base_td_guest_inst, vm_ssh_key, output,
+                                  cmdarr, output_file)
+    assert len(lines) == 1
+    str_freq = re.findall("Detected (.+?) MHz", lines[0])
+    guest_freq = int(float(str_freq[0].strip())) * 1000
+    LOG.info("TD guest tsc frequency is %d", guest_freq)
     assert host_freq == guest_freq
@@ -21,18 +21,16 @@ DATE_SUFFIX = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
 pytestmark = [
     pytest.mark.vm_kernel("latest-guest-kernel"),       # from artifacts.yaml
     pytest.mark.vm_image("latest-guest-image"),    # from artifacts.yaml
+    pytest.mark.tdx,
 ]
 
 
 @pytest.fixture(scope="function")
-def base_td_guest_inst(vm_factory, vm_ssh_pubkey):
+def base_td_guest_inst(vm_factory):
     """
     Create and start a td guest instance
     """
     td_inst = vm_factory.new_vm(VM_TYPE_TD)
-    # customize the VM image
-    td_inst.image.inject_root_ssh_key(vm_ssh_pubkey)
-
     # create and start VM instance
     td_inst.create()
     td_inst.start()
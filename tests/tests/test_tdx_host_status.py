@@ -2,17 +2,32 @@
 Basic host status checking for MKTME, TDX, SGX, SEAMRR etc.
 """
 
+import functools
 import logging
 import os.path
 import glob
+import pytest
 from pycloudstack import msr, dut
 
 __author__ = 'cpio'
 
 LOG = logging.getLogger(__name__)
 
+# Disable redefined-outer-name since it is false positive for pytest's fixture
+# pylint: disable=redefined-outer-name
 
-def test_tdx_enabled_in_bios():
+
+@pytest.fixture(scope="module")
+def read_msr():
+    """
+    Read a MSR on its first use and keep the value for the other tests of
+    the module, so a register missing on the host only fails its own tests.
+    """
+    msr.MSR()
+    return functools.lru_cache(maxsize=None)(msr.MSR.readmsr)
+
+
+def test_tdx_enabled_in_bios(read_msr):
     """
     Check whether the bit 11 for MSR 0x1401, 1 means TDX is enabled in BIOS.
 
@@ -22,15 +37,14 @@ def test_tdx_enabled_in_bios():
     2. Check whether bit 11 is 1
     3. If not 1, print the value of MSR 0xa0 for error code
     """
-    msrobj = msr.MSR()
-    tdx_val = msrobj.readmsr(0x1401, 11, 11)
+    tdx_val = msr.MSR.getbits(read_msr(msr.MSR.IA32_SEAMRR_PHYS_MASK), 11, 11)
     if tdx_val != 1:
-        error_val = msrobj.readmsr(0xa0)
+        error_val = read_msr(msr.MSR.SGX_MCU_ERRORCODE)
         LOG.error("Error (MSR 0xa0): %X", error_val)
     assert tdx_val == 1
 
 
-def test_mktme_enabled_in_bios():
+def test_mktme_enabled_in_bios(read_msr):
     """
     Check whether MK-TME is enabled in BIOS
     https://software.intel.com/sites/default/files/managed/a5/16/Multi-Key-Total-Memory-Encryption-Spec.pdf
@@ -41,12 +55,11 @@ def test_mktme_enabled_in_bios():
     2. Check whether bit 1 is 1
     3. If not 1, the MK-TME is not enabled
     """
-    msrobj = msr.MSR()
-    mktme_val = msrobj.readmsr(msr.MSR.IA32_TME_ACTIVATE)
+    mktme_val = read_msr(msr.MSR.IA32_TME_ACTIVATE)
     assert mktme_val & 0x2 != 0
 
 
-def test_sgx_enabled_in_bios():
+def test_sgx_enabled_in_bios(read_msr):
     """
     Check whether SGX is enabled in BIOS
     https://software.intel.com/sites/default/files/managed/48/88/329298-002.pdf
@@ -57,8 +70,7 @@ def test_sgx_enabled_in_bios():
     2. Check whether bit 18 is 1
     3. If not 1, the SGX is not enabled
     """
-    msrobj = msr.MSR()
-    sgx_val = msrobj.readmsr(msr.MSR.IA32_FEATURE_CONTROL, 18, 18)
+    sgx_val = msr.MSR.getbits(read_msr(msr.MSR.IA32_FEATURE_CONTROL), 18, 18)
     assert sgx_val == 1
 
 
@@ -76,55 +88,50 @@ def test_sgx_supported_in_cpuinfo():
     assert dut.DUT.support_sgx()
 
 
-def test_check_mktme_keyid_bits():
+def test_check_mktme_keyid_bits(read_msr):
     """
     check Keys bits of MK-TME
     https://software.intel.com/sites/default/files/managed/a5/16/Multi-Key-Total-Memory-Encryption-Spec.pdf
     """
-    msrobj = msr.MSR()
-    mktme_keyid_bits = msrobj.readmsr(msr.MSR.IA32_TME_ACTIVATE, 35, 32)
-    mktme_max_keys = msrobj.readmsr(msr.MSR.IA32_TME_CAPABILITY, 50, 36)
+    mktme_keyid_bits = msr.MSR.getbits(read_msr(msr.MSR.IA32_TME_ACTIVATE), 35, 32)
+    mktme_max_keys = msr.MSR.getbits(read_msr(msr.MSR.IA32_TME_CAPABILITY), 50, 36)
     LOG.info("MK-TME max keys=%d, MK-TME key bits=%d",
         mktme_max_keys, mktme_keyid_bits)
     assert (2 ^ mktme_keyid_bits) < mktme_max_keys
 
-def test_check_tdx_keyid_bits():
+def test_check_tdx_keyid_bits(read_msr):
     """
     check Keys bits of TDX
     """
-    msrobj = msr.MSR()
-    tdx_keyid_bits = msrobj.readmsr(msr.MSR.IA32_TME_ACTIVATE, 39, 36)
-    mktme_max_keys = msrobj.readmsr(msr.MSR.IA32_TME_CAPABILITY, 50, 36)
+    tdx_keyid_bits = msr.MSR.getbits(read_msr(msr.MSR.IA32_TME_ACTIVATE), 39, 36)
+    mktme_max_keys = msr.MSR.getbits(read_msr(msr.MSR.IA32_TME_CAPABILITY), 50, 36)
     LOG.info("MK-TME max keys=%d, TDX key bits=%d",
         mktme_max_keys, tdx_keyid_bits)
     assert (2 ^ tdx_keyid_bits) < mktme_max_keys
 
-def test_check_tdx_key_numbers():
+def test_check_tdx_key_numbers(read_msr):
     """
     check Keys bits of TDX
     """
-    msrobj = msr.MSR()
-    tdx_key_num = msrobj.readmsr(msr.MSR.IA32_MKTME_PARTITIONING, 63, 32)
+    tdx_key_num = msr.MSR.getbits(read_msr(msr.MSR.IA32_MKTME_PARTITIONING), 63, 32)
     LOG.info("TDX key number=%d", tdx_key_num)
     assert tdx_key_num > 0
 
 
-def test_check_sgx_mcheck_error():
+def test_check_sgx_mcheck_error(read_msr):
     """
     check whether SGX mcheck error is 0
     """
-    msrobj = msr.MSR()
-    sgx_mcheck_error = msrobj.readmsr(msr.MSR.SGX_MCU_ERRORCODE)
+    sgx_mcheck_error = read_msr(msr.MSR.SGX_MCU_ERRORCODE)
     LOG.info("SGX MCHECK error=%d", sgx_mcheck_error)
     assert sgx_mcheck_error == 0
 
-def test_check_sgx_debug_status():
+def test_check_sgx_debug_status(read_msr):
     """
     check whether SGX debug is enabled, it should be disabled for attestation
     validation.
     """
-    msrobj = msr.MSR()
-    sgx_debug_status = msrobj.readmsr(msr.MSR.SGX_DEBUG)
+    sgx_debug_status = read_msr(msr.MSR.SGX_DEBUG)
     LOG.info("SGX Debug =%d", sgx_debug_status)
 
 
@@ -21,10 +21,11 @@ LOG = logging.getLogger(__name__)
 pytestmark = [
     pytest.mark.vm_image("latest-guest-image"),
     pytest.mark.vm_kernel("latest-guest-kernel"),
+    pytest.mark.tdx,
 ]
 
 
-def test_tdguest_with_legacy_base(vm_factory):
+def test_tdguest_with_legacy_base(vm_factory, async_boot):
     """
     Test the different type VM run parallel
 
@@ -33,16 +34,18 @@ def test_tdguest_with_legacy_base(vm_factory):
     1. Launch a TD guest
     2. Launch a legacy guest
     3. Launch an OVMF guest
+
+    The three guests boot at the same time.
     """
     LOG.info("Create a TD guest")
-    td_inst = vm_factory.new_vm(VM_TYPE_TD, auto_start=True)
+    td_boot = async_boot(vm_factory.new_vm(VM_TYPE_TD))
 
     LOG.info("Create a legacy guest")
-    legacy_inst = vm_factory.new_vm(VM_TYPE_LEGACY, auto_start=True)
+    legacy_boot = async_boot(vm_factory.new_vm(VM_TYPE_LEGACY))
 
     LOG.info("Create an OVMF guest")
-    efi_inst = vm_factory.new_vm(VM_TYPE_EFI, auto_start=True)
+    efi_boot = async_boot(vm_factory.new_vm(VM_TYPE_EFI))
 
-    assert td_inst.wait_for_ssh_ready(), "Could not reach TD VM"
-    assert legacy_inst.wait_for_ssh_ready(), "Could not reach legacy VM"
-    assert efi_inst.wait_for_ssh_ready(), "Could not reach EFI VM"
+    assert td_boot.result(), "Could not reach TD VM"
+    assert legacy_boot.result(), "Could not reach legacy VM"
+    assert efi_boot.result(), "Could not reach EFI VM"
@@ -0,0 +1,62 @@
+"""
+Test the VM pool used by the tests which only boot and stop a guest
+"""
+
+import logging
+import pytest
+from pycloudstack.vmparam import VM_TYPE_EFI, VM_STATE_RUNNING
+
+__author__ = 'cpio'
+
+LOG = logging.getLogger(__name__)
+
+
+# pylint: disable=invalid-name
+pytestmark = [
+    pytest.mark.vm_image("latest-guest-image"),
+    pytest.mark.vm_kernel("latest-guest-kernel"),
+    pytest.mark.timeout(300),
+]
+
+
+def test_pool_reuse(vm_pool):
+    """
+    Test a released VM is started again by the next acquire of its type, and
+    its state is tracked from lifecycle events again.
+
+    Step 1: Acquire a guest and release it
+    Step 2: Acquire a guest of the same type, it must be the released one
+    Step 3: Check the guest is running and reachable via SSH
+    """
+    LOG.info("Acquire guest")
+    inst = vm_pool.acquire(VM_TYPE_EFI)
+    assert inst.wait_for_ssh_ready(strategy="expo"), "Boot timeout"
+    vm_pool.release(inst)
+
+    LOG.info("Acquire guest again")
+    reused = vm_pool.acquire(VM_TYPE_EFI)
+    try:
+        assert reused is inst, "Released guest is not reused"
+        assert reused.vmm.event_tracked, "Lifecycle event is not registered again"
+        assert reused.wait_for_state(VM_STATE_RUNNING), "Restart fail"
+        assert reused.wait_for_ssh_ready(strategy="expo"), "Boot timeout"
+    finally:
+        vm_pool.release(reused)
+
+
+def test_pool_discard_failed(vm_pool):
+    """
+    Test a VM released from a failed test is removed instead of reused.
+
+    Step 1: Acquire a guest and raise within the with block
+    Step 2: Check the guest is removed from the factory
+    Step 3: Check the next acquire does not hand out the removed guest
+    """
+    with pytest.raises(RuntimeError):
+        with vm_pool.guest(VM_TYPE_EFI) as inst:
+            raise RuntimeError("test failure")
+
+    assert inst.name not in vm_pool.factory.vms, "Failed guest is not removed"
+
+    with vm_pool.guest(VM_TYPE_EFI) as other:
+        assert other is not inst, "Failed guest is reused"
@@ -5,7 +5,6 @@ Please make sure QEMU guest agent is installed in your guest image.
 """
 
 import logging
-import time
 import pytest
 from libvirt import libvirtError, VIR_ERR_AGENT_UNRESPONSIVE
 
@@ -22,74 +21,28 @@ pytestmark = [
 ]
 
 
-def test_tdvm_qga_reboot(vm_factory):
+@pytest.mark.parametrize("vm_type", [VM_TYPE_TD, VM_TYPE_EFI, VM_TYPE_LEGACY],
+                         ids=["td", "efi", "legacy"])
+def test_qga_reboot(vm_pool, vm_type):
     """
-    Test rebooting a Legacy guest using QEMU Guest Agent command
+    Test rebooting a TD/EFI/Legacy guest using QEMU Guest Agent command
 
-    Step 1: Create Legacy guest
-    Step 2: Send command to QEMU Guest agent to reboot the Legacy guest
+    Step 1: Start guest from the pool
+    Step 2: Send command to QEMU Guest agent to reboot the guest
     """
 
-    LOG.info("Create Legacy guest")
-    inst = vm_factory.new_vm(VM_TYPE_TD, auto_start=True)
-    inst.wait_for_ssh_ready()
-
-    LOG.info("Request QEMU Guest Agent to reboot the Legacy guest")
-    # QEMU Guest Agent reboots the Legacy guest down abruptly, checking
-    # for VM state does not work.
-    try:
-        inst.vmm.qemu_agent_reboot()
-    except libvirtError as e:
-        LOG.info(e)
-        assert e.get_error_code() == VIR_ERR_AGENT_UNRESPONSIVE, "QEMU Guest Agent reboot fail"
-
-    time.sleep(5)
-    assert inst.wait_for_ssh_ready(), "TD Guest did not reboot"
-
-def test_efi_qga_reboot(vm_factory):
-    """
-    Test rebooting a Legacy guest using QEMU Guest Agent command
-
-    Step 1: Create Legacy guest
-    Step 2: Send command to QEMU Guest agent to reboot the Legacy guest
-    """
-
-    LOG.info("Create Legacy guest")
-    inst = vm_factory.new_vm(VM_TYPE_EFI, auto_start=True)
-    inst.wait_for_ssh_ready()
-
-    LOG.info("Request QEMU Guest Agent to reboot the Legacy guest")
-    # QEMU Guest Agent reboots the Legacy guest down abruptly, checking
-    # for VM state does not work.
-    try:
-        inst.vmm.qemu_agent_reboot()
-    except libvirtError as e:
-        LOG.info(e)
-        assert e.get_error_code() == VIR_ERR_AGENT_UNRESPONSIVE, "QEMU Guest Agent reboot fail"
-
-    time.sleep(5)
-    assert inst.wait_for_ssh_ready(), "TD Guest did not reboot"
-
-def test_legacy_qga_reboot(vm_factory):
-    """
-    Test rebooting a Legacy guest using QEMU Guest Agent command
-
-    Step 1: Create Legacy guest
-    Step 2: Send command to QEMU Guest agent to reboot the Legacy guest
-    """
-
-    LOG.info("Create Legacy guest")
-    inst = vm_factory.new_vm(VM_TYPE_LEGACY, auto_start=True)
-    inst.wait_for_ssh_ready()
-
-    LOG.info("Request QEMU Guest Agent to reboot the Legacy guest")
-    # QEMU Guest Agent reboots the Legacy guest down abruptly, checking
-    # for VM state does not work.
-    try:
-        inst.vmm.qemu_agent_reboot()
-    except libvirtError as e:
-        LOG.info(e)
-        assert e.get_error_code() == VIR_ERR_AGENT_UNRESPONSIVE, "QEMU Guest Agent reboot fail"
-
-    time.sleep(5)
-    assert inst.wait_for_ssh_ready(), "TD Guest did not reboot"
+    LOG.info("Start %s guest", vm_type)
+    with vm_pool.guest(vm_type) as inst:
+        assert inst.wait_for_ssh_ready(strategy="expo"), "Boot timeout"
+
+        LOG.info("Request QEMU Guest Agent to reboot the %s guest", vm_type)
+        # QEMU Guest Agent reboots the guest down abruptly, checking
+        # for VM state does not work.
+        try:
+            inst.vmm.qemu_agent_reboot()
+        except libvirtError as e:
+            LOG.info(e)
+            assert e.get_error_code() == VIR_ERR_AGENT_UNRESPONSIVE, \
+                "QEMU Guest Agent reboot fail"
+
+        assert inst.wait_for_reboot(), "Guest did not reboot"
@@ -9,7 +9,6 @@ itself supports. The 'signal' and 'initctl' modes are used by the LXC driver.
 """
 
 import logging
-import time
 import pytest
 from pycloudstack.vmparam import VM_TYPE_LEGACY, VM_STATE_SHUTDOWN, VM_TYPE_EFI, VM_TYPE_TD
 
@@ -24,31 +23,27 @@ pytestmark = [
     pytest.mark.vm_kernel("latest-guest-kernel"),
 ]
 
+# Each VM type is an xdist group, so the three types run on different workers
 testdata = [
-    (VM_TYPE_TD, "default"),
-    (VM_TYPE_TD, "acpi"),
-    (VM_TYPE_TD, "agent"),
-    (VM_TYPE_EFI, "default"),
-    (VM_TYPE_EFI, "acpi"),
-    (VM_TYPE_EFI, "agent"),
-    (VM_TYPE_LEGACY, "default"),
-    (VM_TYPE_LEGACY, "acpi"),
-    (VM_TYPE_LEGACY, "agent"),
+    pytest.param(vm_type, mode, marks=pytest.mark.xdist_group(vm_type))
+    for vm_type in (VM_TYPE_TD, VM_TYPE_EFI, VM_TYPE_LEGACY)
+    for mode in ("default", "acpi", "agent")
 ]
 
 
 @pytest.mark.parametrize("vm_type, mode", testdata)
-def test_vm_shutdown_mode(vm_factory, vm_type, mode):
+def test_vm_shutdown_mode(vm_pool, vm_type, mode):
     """
-    Test shutdown guest via Virsh operator with different mode
+    Test shutdown guest via Virsh operator with different mode, the modes of
+    a VM type restart the same pooled guest.
     """
-    LOG.info("Create guest")
-    inst = vm_factory.new_vm(vm_type, auto_start=True)
-    inst.wait_for_ssh_ready()
-
-    LOG.info("Shutdown guest")
-    inst.shutdown(mode)
-
-    # Sleep for a while
-    time.sleep(3)
-    assert inst.wait_for_state(VM_STATE_SHUTDOWN, timeout=60), "Shutdown fail"
+    LOG.info("Start guest")
+    with vm_pool.guest(vm_type) as inst:
+        assert inst.wait_for_ssh_ready(strategy="expo"), "Boot timeout"
+
+        LOG.info("Shutdown guest")
+        inst.shutdown(mode)
+        # The shutoff state must hold, a domain going down can briefly be
+        # reported in another state during the ACPI handoff
+        assert inst.wait_for_state(VM_STATE_SHUTDOWN, timeout=60, min_stable=0.5), \
+            "Shutdown fail"
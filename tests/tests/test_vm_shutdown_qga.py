@@ -21,67 +21,26 @@ pytestmark = [
 ]
 
 
-def test_tdvm_qga_shutdown(vm_factory):
+@pytest.mark.parametrize("vm_type", [VM_TYPE_TD, VM_TYPE_EFI, VM_TYPE_LEGACY],
+                         ids=["td", "efi", "legacy"])
+def test_qga_shutdown(vm_pool, vm_type):
     """
-    Test shutting down a TD guest using QEMU Guest Agent command
+    Test shutting down a TD/EFI/Legacy guest using QEMU Guest Agent command
 
-    Step 1: Create TD guest
-    Step 2: Send command to QEMU Guest agent to shutdown the TD guest
+    Step 1: Start guest from the pool
+    Step 2: Send command to QEMU Guest agent to shutdown the guest
     """
 
-    LOG.info("Create TD guest")
-    inst = vm_factory.new_vm(VM_TYPE_TD)
-    inst.create()
-    inst.start()
-    assert inst.wait_for_ssh_ready()
-
-    LOG.info("Request QEMU Guest Agent to shutdown the TD guest")
-    # QEMU Guest Agent shuts the TD guest down abruptly, checking
-    # for VM state does not work.
-    try:
-        inst.vmm.qemu_agent_shutdown()
-    except libvirtError as e:
-        LOG.info(e)
-        assert e.get_error_code() == VIR_ERR_AGENT_UNRESPONSIVE, "QEMU Guest Agent shutdown fail"
-
-def test_efi_qga_shutdown(vm_factory):
-    """
-    Test shutting down a EFI guest using QEMU Guest Agent command
-
-    Step 1: Create EFI guest
-    Step 2: Send command to QEMU Guest agent to shutdown the EFI guest
-    """
-
-    LOG.info("Create EFI guest")
-    inst = vm_factory.new_vm(VM_TYPE_EFI)
-    inst.create()
-    inst.start()
-    assert inst.wait_for_ssh_ready()
-
-    LOG.info("Request QEMU Guest Agent to shutdown the EFI guest")
-    try:
-        inst.vmm.qemu_agent_shutdown()
-    except libvirtError as e:
-        LOG.info(e)
-        assert e.get_error_code() == VIR_ERR_AGENT_UNRESPONSIVE, "QEMU Guest Agent shutdown fail"
-
-def test_legacy_qga_shutdown(vm_factory):
-    """
-    Test shutting down a legacy VM using QEMU Guest Agent command
-
-    Step 1: Create legacy VM
-    Step 2: Send command to QEMU Guest agent to shutdown the legacy VM
-    """
-
-    LOG.info("Create legacy VM")
-    inst = vm_factory.new_vm(VM_TYPE_LEGACY)
-    inst.create()
-    inst.start()
-    assert inst.wait_for_ssh_ready()
-
-    LOG.info("Request QEMU Guest Agent to shutdown the legacy VM")
-    try:
-        inst.vmm.qemu_agent_shutdown()
-    except libvirtError as e:
-        LOG.info(e)
-        assert e.get_error_code() == VIR_ERR_AGENT_UNRESPONSIVE, "QEMU Guest Agent shutdown fail"
+    LOG.info("Start %s guest", vm_type)
+    with vm_pool.guest(vm_type) as inst:
+        assert inst.wait_for_ssh_ready(strategy="expo")
+
+        LOG.info("Request QEMU Guest Agent to shutdown the %s guest", vm_type)
+        # QEMU Guest Agent shuts the guest down abruptly, checking
+        # for VM state does not work.
+        try:
+            inst.vmm.qemu_agent_shutdown()
+        except libvirtError as e:
+            LOG.info(e)
+            assert e.get_error_code() == VIR_ERR_AGENT_UNRESPONSIVE, \
+                "QEMU Guest Agent shutdown fail"
@@ -0,0 +1,18 @@
+"""
+Check the tests are distributed to the xdist workers by module
+"""
+
+import pytest
+
+__author__ = 'cpio'
+
+
+def test_module_xdist_group(request):
+    """
+    Test a test without xdist_group mark is in the group of its module, the
+    xdist worker appends the group to the node ID with "--dist=loadgroup".
+    """
+    if not hasattr(request.config, "workerinput"):
+        pytest.skip("Not running in a xdist worker")
+    assert request.node.nodeid.endswith("@" + __name__), \
+        f"{request.node.nodeid} is not in the group of its module"
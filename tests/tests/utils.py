@@ -0,0 +1,17 @@
+"""
+Helpers shared by the test modules
+"""
+
+__author__ = 'cpio'
+
+
+def first_match(lines, patt):
+    """
+    Search the output line by line and stop at the first match, the output
+    of the benchmark can be large so it is not joined into one string.
+    """
+    for line in lines:
+        match = patt.search(line)
+        if match:
+            return match
+    return None